@@ -32,7 +32,7 @@
 
 {
     'name': 'VoIP WebRTC FreePBX',
-    'version': '18.0.1.0.1',
+    'version': '18.0.1.0.2',
     'category': 'Productivity/VoIP',
     'summary': 'VoIP and WebRTC integration with FreePBX server for call management',
     'description': """
@@ -56,6 +56,11 @@
         * Real-time call status updates
         * Audio recording and storage
         * Call logs and reporting
+        
+        Optional Dependencies:
+        ----------------------
+        * mutagen (Python): reads the duration of MP3, OGG and M4A hold music
+        * ffmpeg (binary): compresses hold music
     """,
     'author': 'Mohamed Samir',
     'maintainer': 'odoo-vip.com',
@@ -78,6 +83,7 @@
         'views/voip_menus.xml',
         'views/voip_event_views.xml',
         'views/voip_hold_music_views.xml',
+        'views/voip_hold_music_templates.xml',
         'data/voip_data.xml',
     ],
     'assets': {
@@ -97,6 +103,7 @@
             'voip_webrtc_freepbx/static/src/css/hold_music_styles.css',
         ],
     },
+    # mutagen is optional: without it only WAV hold music durations are detected
     'external_dependencies': {
         'python': [],
     },
@@ -30,9 +30,9 @@
 #################################################################################
 from odoo import http, fields
 from odoo.http import request, Response
-import json
 import logging
 from ..utils.logging_utils import VoipLoggingUtils
+from ..utils.json_utils import json_dumps, json_loads
 
 _logger = logging.getLogger(__name__)
 
@@ -40,6 +40,10 @@ _logger = logging.getLogger(__name__)
 class VoipBaseController(http.Controller):
     """Base controller with common VoIP functionality"""
 
+    def json_response(self, payload, status=200):
+        """Return payload as an application/json HTTP response"""
+        return Response(json_dumps(payload), content_type='application/json', status=status)
+
     def get_current_voip_user(self):
         """Get current user's VoIP configuration"""
         try:
@@ -99,16 +103,7 @@ class VoipBaseController(http.Controller):
             if not phone:
                 return {'success': False, 'error': 'Phone number required'}
             
-            # Clean phone number
-            clean_phone = phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
-            
-            # Search for partner
-            partner = request.env['res.partner'].search([
-                '|', '|',
-                ('phone', 'ilike', clean_phone),
-                ('mobile', 'ilike', clean_phone),
-                ('phone', 'ilike', phone)
-            ], limit=1)
+            partner = request.env['res.partner']._voip_find_by_phone(phone)
             
             if partner:
                 return {
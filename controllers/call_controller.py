@@ -30,9 +30,8 @@
 #################################################################################
 from odoo import http, fields
 from odoo.http import request, Response
-import json
 import logging
-from .base_controller import VoipBaseController
+from .base_controller import VoipBaseController, json_dumps, json_loads
 from ..utils.logging_utils import VoipLoggingUtils
 
 _logger = logging.getLogger(__name__)
@@ -291,10 +290,6 @@ class VoipCallController(VoipBaseController):
                 call._invalidate_cache()
                 call.write(update_vals)
             
-            # Force recompute of duration field
-            call._compute_duration()
-            call._compute_duration_display()
-            
             # Log the duration update
             VoipLoggingUtils.log_if_enabled(
                 request.env, _logger, 'info', 
@@ -560,16 +555,8 @@ class VoipCallController(VoipBaseController):
             if not phone:
                 return {'success': False, 'error': 'Phone number required'}
             
-            # Clean phone number
-            clean_phone = phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
-            
             # Search for partner
-            partner = request.env['res.partner'].search([
-                '|', '|',
-                ('phone', 'ilike', clean_phone),
-                ('mobile', 'ilike', clean_phone),
-                ('phone', 'ilike', phone)
-            ], limit=1)
+            partner = request.env['res.partner']._voip_find_by_phone(phone)
             
             if partner:
                 return {
@@ -626,10 +613,10 @@ class VoipCallController(VoipBaseController):
             # Try to parse JSON body if present
             if request.httprequest.data:
                 try:
-                    request_data = json.loads(request.httprequest.data.decode('utf-8'))
+                    request_data = json_loads(request.httprequest.data)
                     _logger.info(f"📦 JSON Body: {request_data}")
                     limit = request_data.get('limit', kwargs.get('limit', 100))
-                except (json.JSONDecodeError, AttributeError, UnicodeDecodeError) as e:
+                except (ValueError, AttributeError) as e:
                     _logger.warning(f"⚠️ Could not parse JSON body: {e}, trying query params")
                     # If JSON parsing fails, try query params
                     limit = kwargs.get('limit', 100)
@@ -694,7 +681,7 @@ class VoipCallController(VoipBaseController):
             
             # Serialize to JSON
             try:
-                json_str = json.dumps(response_data, ensure_ascii=False, default=str)
+                json_str = json_dumps(response_data, default=str)
                 _logger.info(f"✅ Response serialized to JSON (size: {len(json_str)} bytes)")
             except (TypeError, ValueError) as e:
                 _logger.error(f"❌ Response is NOT JSON-serializable: {e}")
@@ -733,7 +720,7 @@ class VoipCallController(VoipBaseController):
             
             # Serialize error response to JSON
             try:
-                error_json = json.dumps(error_response, ensure_ascii=False, default=str)
+                error_json = json_dumps(error_response, default=str)
                 _logger.info("✅ Error response serialized to JSON")
             except Exception as json_err:
                 _logger.error(f"❌ Error response is NOT JSON-serializable: {json_err}")
@@ -744,7 +731,7 @@ class VoipCallController(VoipBaseController):
                     'contacts': [],
                     'count': 0
                 }
-                error_json = json.dumps(error_response, ensure_ascii=False)
+                error_json = json_dumps(error_response)
             
             # Return HTTP Error Response
             return Response(
@@ -30,11 +30,14 @@
 #################################################################################
 from odoo import http
 from odoo.http import request, Response
-import json
 import base64
+import gzip
+import hashlib
 import time
 import logging
+from werkzeug.http import http_date
 from .base_controller import VoipBaseController
+from ..utils.audio_utils import VoipAudioUtils, MELODY_FREQUENCIES, HOLD_MUSIC_HARMONICS
 
 _logger = logging.getLogger(__name__)
 
@@ -42,6 +45,33 @@ _logger = logging.getLogger(__name__)
 class VoipHoldMusicController(VoipBaseController):
     """Controller for managing hold music functionality"""
 
+    def _render_music_page(self, template, music, music_url):
+        """Return the HTML page of template for music, gzipped when accepted
+
+        Pages carry an ETag derived from the rendered HTML, so it follows
+        edits of the record as well as of the template, and a revalidating
+        browser gets a 304 instead of the page.
+        """
+        gzipped = 'gzip' in request.httprequest.accept_encodings
+        html = request.env['ir.ui.view']._render_template(template, {
+            'music': music,
+            'music_url': music_url,
+        }).encode()
+        etag = f'"{hashlib.md5(html).hexdigest()}{"-gz" if gzipped else ""}"'
+        headers = [
+            ('Vary', 'Accept-Encoding'),
+            ('ETag', etag),
+            # Rendered for an authenticated user: browsers only, not shared caches
+            ('Cache-Control', 'private, max-age=300'),
+        ]
+        if etag in request.httprequest.if_none_match:
+            return Response(status=304, headers=headers)
+
+        if gzipped:
+            html = gzip.compress(html, 6)
+            headers.append(('Content-Encoding', 'gzip'))
+        return Response(html, content_type='text/html; charset=utf-8', headers=headers)
+
     @http.route('/voip/hold-music/list', type='json', auth='user', methods=['POST'], csrf=False)
     def get_hold_music_list_legacy(self, **kwargs):
         """Get list of available hold music files (legacy endpoint)"""
@@ -56,7 +86,7 @@ class VoipHoldMusicController(VoipBaseController):
             try:
                 music_list = request.env['voip.hold.music'].get_available_music(server_id)
             except Exception as e:
-                _logger.warning(f"Error getting existing music: {e}")
+                _logger.warning("Error getting existing music: %s", e)
                 music_list = []
             
             # If no music found, create default music only if no uploaded files exist
@@ -74,7 +104,7 @@ class VoipHoldMusicController(VoipBaseController):
                         if default_music:
                             music_list = [default_music]
                     except Exception as e:
-                        _logger.error(f"Error creating default music: {e}")
+                        _logger.error("Error creating default music: %s", e)
                         music_list = []
                 else:
                     _logger.info("Found uploaded music files, not creating default music")
@@ -84,7 +114,7 @@ class VoipHoldMusicController(VoipBaseController):
                 try:
                     self.fix_corrupted_music_files()
                 except Exception as e:
-                    _logger.warning(f"Error fixing corrupted music: {e}")
+                    _logger.warning("Error fixing corrupted music: %s", e)
             
             return {
                 'success': True,
@@ -105,12 +135,24 @@ class VoipHoldMusicController(VoipBaseController):
             if not music.exists():
                 return Response('Music not found', status=404)
             
-            if not music.music_file:
+            # checksum is only set when a file is stored; reading it does not load the file
+            if not music.checksum:
                 return Response('No music file', status=404)
             
             # Increment usage count
             music.action_increment_usage()
             
+            etag = f'"{music.checksum}"'
+            cache_headers = [
+                ('ETag', etag),
+                ('Last-Modified', http_date(music.write_date)),
+                ('Cache-Control', 'public, max-age=86400'),
+            ]
+            
+            # Browser already has this exact file: skip loading and decoding it
+            if etag in request.httprequest.if_none_match:
+                return Response(status=304, headers=cache_headers)
+            
             # Determine content type
             content_type = 'audio/mpeg'
             if music.format == 'wav':
@@ -120,23 +162,18 @@ class VoipHoldMusicController(VoipBaseController):
             elif music.format == 'm4a':
                 content_type = 'audio/mp4'
             
-            # Decode the binary data
-            import base64
-            try:
-                music_data = base64.b64decode(music.music_file)
-            except Exception as e:
-                _logger.error(f"Error decoding music file: {e}")
-                return Response('Invalid music file', status=500)
-            
-            return Response(
-                music_data,
-                content_type=content_type,
-                headers=[
-                    ('Content-Disposition', f'inline; filename="{music.music_filename or music.name}"'),
-                    ('Cache-Control', 'public, max-age=3600'),
-                    ('Content-Length', str(len(music_data))),
-                ]
+            # Stream the attachment from the filestore (X-Sendfile when enabled,
+            # Range requests supported) instead of decoding it in memory
+            stream = request.env['ir.binary']._get_stream_from(
+                music, 'music_file',
+                filename=music.music_filename or music.name,
+                mimetype=content_type,
             )
+            stream.etag = music.checksum
+            stream.last_modified = music.write_date
+            response = stream.get_response(as_attachment=False, max_age=86400)
+            response.cache_control.public = True
+            return response
             
         except Exception as e:
             _logger.exception("Error serving hold music file: %s", str(e))
@@ -152,223 +189,13 @@ class VoipHoldMusicController(VoipBaseController):
             if not music.exists():
                 return Response('Music not found', status=404)
             
-            if not music.music_file:
+            if not music.checksum:
                 return Response('No music file available', status=404)
             
-            # Get music URL
-            music_url = f'/voip_webrtc_freepbx/hold_music/file/{music_id}'
-            
-            html = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Test Hold Music - {music.name}</title>
-                <style>
-                    body {{
-                        font-family: Arial, sans-serif;
-                        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                        margin: 0;
-                        padding: 20px;
-                        display: flex;
-                        justify-content: center;
-                        align-items: center;
-                        min-height: 100vh;
-                    }}
-                    .test-container {{
-                        background: white;
-                        border-radius: 15px;
-                        padding: 40px;
-                        box-shadow: 0 10px 30px rgba(0,0,0,0.3);
-                        text-align: center;
-                        max-width: 500px;
-                        width: 100%;
-                    }}
-                    .music-icon {{
-                        font-size: 64px;
-                        color: #667eea;
-                        margin-bottom: 20px;
-                    }}
-                    h1 {{
-                        color: #333;
-                        margin-bottom: 10px;
-                    }}
-                    .music-info {{
-                        color: #666;
-                        margin-bottom: 30px;
-                        font-size: 16px;
-                    }}
-                    .audio-player {{
-                        width: 100%;
-                        margin: 20px 0;
-                        border-radius: 10px;
-                        box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-                    }}
-                    .controls {{
-                        margin-top: 20px;
-                    }}
-                    .btn {{
-                        background: #667eea;
-                        color: white;
-                        border: none;
-                        padding: 12px 24px;
-                        border-radius: 25px;
-                        cursor: pointer;
-                        font-size: 16px;
-                        margin: 0 10px;
-                        transition: all 0.3s ease;
-                    }}
-                    .btn:hover {{
-                        background: #5a6fd8;
-                        transform: translateY(-2px);
-                    }}
-                    .status {{
-                        margin-top: 20px;
-                        padding: 15px;
-                        border-radius: 10px;
-                        background: #f8f9fa;
-                        border-left: 4px solid #667eea;
-                    }}
-                    .volume-control {{
-                        margin: 20px 0;
-                        text-align: left;
-                    }}
-                    .volume-control label {{
-                        display: block;
-                        margin-bottom: 10px;
-                        font-weight: bold;
-                        color: #333;
-                    }}
-                    .volume-slider {{
-                        width: 100%;
-                        height: 8px;
-                        border-radius: 5px;
-                        background: #ddd;
-                        outline: none;
-                        -webkit-appearance: none;
-                    }}
-                    .volume-slider::-webkit-slider-thumb {{
-                        -webkit-appearance: none;
-                        appearance: none;
-                        width: 20px;
-                        height: 20px;
-                        border-radius: 50%;
-                        background: #667eea;
-                        cursor: pointer;
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="test-container">
-                    <div class="music-icon">🎵</div>
-                    <h1>Test Hold Music</h1>
-                    <div class="music-info">
-                        <strong>{music.name}</strong><br>
-                        Format: {music.format.upper()}<br>
-                        Size: {music.file_size or 'Unknown'} bytes<br>
-                        Quality: {music.quality or 'Unknown'}
-                    </div>
-                    
-                    <audio id="musicPlayer" class="audio-player" controls preload="auto">
-                        <source src="{music_url}" type="audio/{music.format}">
-                        Your browser does not support the audio element.
-                    </audio>
-                    
-                    <div class="volume-control">
-                        <label for="volumeSlider">Volume: <span id="volumeValue">70</span>%</label>
-                        <input type="range" id="volumeSlider" class="volume-slider" 
-                               min="0" max="100" value="70" step="1">
-                    </div>
-                    
-                    <div class="controls">
-                        <button class="btn" onclick="playMusic()">▶️ Play</button>
-                        <button class="btn" onclick="pauseMusic()">⏸️ Pause</button>
-                        <button class="btn" onclick="stopMusic()">⏹️ Stop</button>
-                        <button class="btn" onclick="testLoop()">🔄 Test Loop</button>
-                    </div>
-                    
-                    <div class="status" id="status">
-                        Ready to test music. Click Play to start.
-                    </div>
-                </div>
-                
-                <script>
-                    const audio = document.getElementById('musicPlayer');
-                    const volumeSlider = document.getElementById('volumeSlider');
-                    const volumeValue = document.getElementById('volumeValue');
-                    const status = document.getElementById('status');
-                    
-                    // Set initial volume
-                    audio.volume = 0.7;
-                    
-                    // Volume control
-                    volumeSlider.addEventListener('input', function() {{
-                        const volume = this.value / 100;
-                        audio.volume = volume;
-                        volumeValue.textContent = this.value;
-                    }});
-                    
-                    // Audio event listeners
-                    audio.addEventListener('loadstart', () => {{
-                        status.innerHTML = '🔄 Loading music file...';
-                    }});
-                    
-                    audio.addEventListener('canplay', () => {{
-                        status.innerHTML = '✅ Music loaded successfully! Ready to play.';
-                    }});
-                    
-                    audio.addEventListener('play', () => {{
-                        status.innerHTML = '▶️ Playing: ' + audio.currentSrc;
-                    }});
-                    
-                    audio.addEventListener('pause', () => {{
-                        status.innerHTML = '⏸️ Music paused';
-                    }});
-                    
-                    audio.addEventListener('ended', () => {{
-                        status.innerHTML = '🏁 Music finished playing';
-                    }});
-                    
-                    audio.addEventListener('error', (e) => {{
-                        status.innerHTML = '❌ Error loading music: ' + e.message;
-                        console.error('Audio error:', e);
-                    }});
-                    
-                    // Control functions
-                    function playMusic() {{
-                        audio.play().catch(e => {{
-                            status.innerHTML = '❌ Error playing music: ' + e.message;
-                        }});
-                    }}
-                    
-                    function pauseMusic() {{
-                        audio.pause();
-                    }}
-                    
-                    function stopMusic() {{
-                        audio.pause();
-                        audio.currentTime = 0;
-                    }}
-                    
-                    function testLoop() {{
-                        audio.loop = !audio.loop;
-                        status.innerHTML = audio.loop ? '🔄 Loop enabled' : '🔄 Loop disabled';
-                    }}
-                    
-                    // Auto-play when loaded (if user interaction allows)
-                    audio.addEventListener('canplay', () => {{
-                        // Only auto-play if user has interacted with the page
-                        if (document.hasFocus()) {{
-                            audio.play().catch(() => {{
-                                // Auto-play blocked, that's okay
-                            }});
-                        }}
-                    }});
-                </script>
-            </body>
-            </html>
-            """
-            
-            return Response(html, content_type='text/html')
+            return self._render_music_page(
+                'voip_webrtc_freepbx.hold_music_test', music,
+                f'/voip_webrtc_freepbx/hold_music/file/{music_id}',
+            )
             
         except Exception as e:
             _logger.exception("Error in test_hold_music: %s", str(e))
@@ -383,86 +210,10 @@ class VoipHoldMusicController(VoipBaseController):
             if not music.exists():
                 return Response('Music not found', status=404)
             
-            html = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Hold Music Preview - {music.name}</title>
-                <style>
-                    body {{
-                        font-family: Arial, sans-serif;
-                        background: #f5f5f5;
-                        margin: 0;
-                        padding: 20px;
-                        display: flex;
-                        justify-content: center;
-                        align-items: center;
-                        min-height: 100vh;
-                    }}
-                    .preview-container {{
-                        background: white;
-                        border-radius: 10px;
-                        padding: 30px;
-                        box-shadow: 0 4px 20px rgba(0,0,0,0.1);
-                        text-align: center;
-                        max-width: 400px;
-                    }}
-                    .music-icon {{
-                        font-size: 48px;
-                        color: #9b8bb3;
-                        margin-bottom: 20px;
-                    }}
-                    .music-name {{
-                        font-size: 24px;
-                        font-weight: bold;
-                        margin-bottom: 10px;
-                        color: #333;
-                    }}
-                    .music-description {{
-                        color: #666;
-                        margin-bottom: 20px;
-                    }}
-                    audio {{
-                        width: 100%;
-                        margin: 20px 0;
-                    }}
-                    .controls {{
-                        margin-top: 20px;
-                    }}
-                    .btn {{
-                        background: #9b8bb3;
-                        color: white;
-                        border: none;
-                        padding: 10px 20px;
-                        border-radius: 5px;
-                        cursor: pointer;
-                        margin: 0 5px;
-                    }}
-                    .btn:hover {{
-                        background: #8a7ba3;
-                    }}
-                </style>
-            </head>
-            <body>
-                <div class="preview-container">
-                    <div class="music-icon">🎵</div>
-                    <div class="music-name">{music.name}</div>
-                    <div class="music-description">{music.description or 'No description'}</div>
-                    
-                    <audio controls>
-                        <source src="/voip_webrtc_freepbx/hold_music/file/{music_id}" type="audio/{music.format}">
-                        Your browser does not support the audio element.
-                    </audio>
-                    
-                    <div class="controls">
-                        <button class="btn" onclick="window.close()">Close</button>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            return Response(html, content_type='text/html')
+            return self._render_music_page(
+                'voip_webrtc_freepbx.hold_music_preview', music,
+                f'/voip_webrtc_freepbx/hold_music/file/{music_id}',
+            )
             
         except Exception as e:
             _logger.exception("Error previewing hold music: %s", str(e))
@@ -486,69 +237,10 @@ class VoipHoldMusicController(VoipBaseController):
                 return None
             
             # Create a proper WAV file for default music
-            import base64
-            import io
-            import wave
-            import math
-            
-            # Create a pleasant melody
-            sample_rate = 44100
-            duration = 30  # 30 seconds
-            buffer = io.BytesIO()
-            
-            with wave.open(buffer, 'wb') as wav_file:
-                wav_file.setnchannels(1)  # Mono
-                wav_file.setsampwidth(2)  # 16-bit
-                wav_file.setframerate(sample_rate)
-                
-                # Create a pleasant melody
-                melody_notes = [
-                    (440, 2),    # A4
-                    (523.25, 2), # C5
-                    (659.25, 2), # E5
-                    (783.99, 2), # G5
-                    (659.25, 2), # E5
-                    (523.25, 2), # C5
-                    (440, 2),    # A4
-                    (392, 2),    # G4
-                ]
-                
-                total_samples = int(sample_rate * duration)
-                samples = []
-                sample_index = 0
-                
-                for note_freq, note_duration in melody_notes:
-                    note_samples = int(sample_rate * note_duration)
-                    end_index = min(sample_index + note_samples, total_samples)
-                    
-                    for i in range(sample_index, end_index):
-                        time = i / sample_rate
-                        # Create a pleasant tone with harmonics
-                        sample = (math.sin(2 * math.pi * note_freq * time) * 0.1 +
-                                 math.sin(2 * math.pi * note_freq * 2 * time) * 0.05 +
-                                 math.sin(2 * math.pi * note_freq * 3 * time) * 0.02)
-                        
-                        # Add some vibrato
-                        vibrato = math.sin(2 * math.pi * 5 * time) * 0.01
-                        sample *= (1 + vibrato)
-                        
-                        # Convert to 16-bit PCM (little-endian)
-                        pcm_sample = int(max(-32768, min(32767, sample * 32767)))
-                        # Convert to bytes (little-endian)
-                        samples.append(pcm_sample & 0xFF)  # Low byte
-                        samples.append((pcm_sample >> 8) & 0xFF)  # High byte
-                    
-                    sample_index = end_index
-                    
-                    # If we've filled the duration, break
-                    if sample_index >= total_samples:
-                        break
-                
-                # Write the samples
-                wav_file.writeframes(bytes(samples))
-            
-            wav_data = buffer.getvalue()
-            wav_base64 = base64.b64encode(wav_data).decode('utf-8')
+            wav_data, wav_base64 = VoipAudioUtils.get_melody_wav(
+                [(freq, 2) for freq in MELODY_FREQUENCIES], 30,
+                harmonics=HOLD_MUSIC_HARMONICS, vibrato=0.01
+            )
             
             # Create hold music record
             music_record = request.env['voip.hold.music'].create({
@@ -574,34 +266,21 @@ class VoipHoldMusicController(VoipBaseController):
     def fix_corrupted_music_files(self):
         """Fix corrupted music files by regenerating them"""
         try:
-            # Find music files with corrupted data
+            # music_file_valid is checked when the file is written, so only
+            # the corrupted records are read here; checksum is set iff a file exists
             corrupted_music = request.env['voip.hold.music'].search([
                 ('active', '=', True),
-                ('music_file', '!=', False)
+                ('checksum', '!=', False),
+                ('music_file_valid', '=', False),
             ])
             
             for music in corrupted_music:
+                _logger.info("Regenerating corrupted music file: %s", music.name)
                 try:
-                    # Check if record still exists
-                    if not music.exists():
-                        _logger.warning(f"Music record {music.id} no longer exists, skipping...")
-                        continue
-                    
-                    # Try to decode the base64 data
-                    import base64
-                    music_data = base64.b64decode(music.music_file)
-                    
-                    # Check if it's a valid WAV file
-                    if not music_data.startswith(b'RIFF') or not b'WAVE' in music_data[:12]:
-                        _logger.info(f"Regenerating corrupted music file: {music.name}")
-                        self.regenerate_music_file(music)
-                        
-                except Exception as e:
-                    _logger.warning(f"Music file {music.name} is corrupted, regenerating...")
-                    try:
+                    with request.env.cr.savepoint():
                         self.regenerate_music_file(music)
-                    except Exception as regen_error:
-                        _logger.error(f"Failed to regenerate music file {music.name}: {regen_error}")
+                except Exception as regen_error:
+                    _logger.error("Failed to regenerate music file %s: %s", music.name, regen_error)
                     
         except Exception as e:
             _logger.exception("Error fixing corrupted music files: %s", str(e))
@@ -609,69 +288,10 @@ class VoipHoldMusicController(VoipBaseController):
     def regenerate_music_file(self, music_record):
         """Regenerate a music file"""
         try:
-            import base64
-            import io
-            import wave
-            import math
-            
-            # Create a pleasant melody
-            sample_rate = 44100
-            duration = 30  # 30 seconds
-            buffer = io.BytesIO()
-            
-            with wave.open(buffer, 'wb') as wav_file:
-                wav_file.setnchannels(1)  # Mono
-                wav_file.setsampwidth(2)  # 16-bit
-                wav_file.setframerate(sample_rate)
-                
-                # Create a pleasant melody
-                melody_notes = [
-                    (440, 2),    # A4
-                    (523.25, 2), # C5
-                    (659.25, 2), # E5
-                    (783.99, 2), # G5
-                    (659.25, 2), # E5
-                    (523.25, 2), # C5
-                    (440, 2),    # A4
-                    (392, 2),    # G4
-                ]
-                
-                total_samples = int(sample_rate * duration)
-                samples = []
-                sample_index = 0
-                
-                for note_freq, note_duration in melody_notes:
-                    note_samples = int(sample_rate * note_duration)
-                    end_index = min(sample_index + note_samples, total_samples)
-                    
-                    for i in range(sample_index, end_index):
-                        time = i / sample_rate
-                        # Create a pleasant tone with harmonics
-                        sample = (math.sin(2 * math.pi * note_freq * time) * 0.1 +
-                                 math.sin(2 * math.pi * note_freq * 2 * time) * 0.05 +
-                                 math.sin(2 * math.pi * note_freq * 3 * time) * 0.02)
-                        
-                        # Add some vibrato
-                        vibrato = math.sin(2 * math.pi * 5 * time) * 0.01
-                        sample *= (1 + vibrato)
-                        
-                        # Convert to 16-bit PCM (little-endian)
-                        pcm_sample = int(max(-32768, min(32767, sample * 32767)))
-                        # Convert to bytes (little-endian)
-                        samples.append(pcm_sample & 0xFF)  # Low byte
-                        samples.append((pcm_sample >> 8) & 0xFF)  # High byte
-                    
-                    sample_index = end_index
-                    
-                    # If we've filled the duration, break
-                    if sample_index >= total_samples:
-                        break
-                
-                # Write the samples
-                wav_file.writeframes(bytes(samples))
-            
-            wav_data = buffer.getvalue()
-            wav_base64 = base64.b64encode(wav_data).decode('utf-8')
+            wav_data, wav_base64 = VoipAudioUtils.get_melody_wav(
+                [(freq, 2) for freq in MELODY_FREQUENCIES], 30,
+                harmonics=HOLD_MUSIC_HARMONICS, vibrato=0.01
+            )
             
             # Update the music record
             music_record.write({
@@ -681,10 +301,10 @@ class VoipHoldMusicController(VoipBaseController):
                 'file_size': len(wav_data)
             })
             
-            _logger.info(f"Regenerated music file: {music_record.name}")
+            _logger.info("Regenerated music file: %s", music_record.name)
             
         except Exception as e:
-            _logger.exception(f"Error regenerating music file {music_record.name}: %s", str(e))
+            _logger.exception("Error regenerating music file %s: %s", music_record.name, str(e))
 
     @http.route('/voip/hold_music/upload_large', type='http', auth='user', methods=['POST'], csrf=False)
     def upload_large_music_file(self, **kwargs):
@@ -715,9 +335,8 @@ class VoipHoldMusicController(VoipBaseController):
             file_data = music_file.read()
             file_size = len(file_data)
             
-            # Convert to base64
-            import base64
-            file_base64 = base64.b64encode(file_data).decode('utf-8')
+            # Convert to base64 (Binary fields accept bytes, no need to decode)
+            file_base64 = base64.b64encode(file_data)
             
             # Update or create music record
             if music_id:
@@ -29,9 +29,7 @@
 # © 2025 — All Rights Reserved — Mohamed Samir Abouelez 
 #################################################################################
 from odoo import http, fields
-from odoo.http import request, Response
-import json
-import base64
+from odoo.http import request
 import time
 import logging
 from .base_controller import VoipBaseController
@@ -76,112 +74,99 @@ class VoipRecordingController(VoipBaseController):
             recording = request.env['voip.recording'].sudo().browse(int(recording_id))
             
             if not recording.exists():
-                return Response(
-                    json.dumps({'success': False, 'error': 'Recording not found'}),
-                    content_type='application/json',
-                    status=404
-                )
+                return self.json_response({'success': False, 'error': 'Recording not found'}, status=404)
             
             file_data = request.httprequest.files.get('file')
             if not file_data:
-                return Response(
-                    json.dumps({'success': False, 'error': 'No file provided'}),
-                    content_type='application/json',
-                    status=400
-                )
-            
-            import base64
-            file_content = base64.b64encode(file_data.read())
+                return self.json_response({'success': False, 'error': 'No file provided'}, status=400)
             
+            content = file_data.read()
             recording.write({
-                'recording_file': file_content,
                 'recording_filename': file_data.filename,
-                'file_size': len(file_content),
+                'file_size': len(content),
                 'state': 'completed',
             })
+            recording._set_recording_file_raw(content)
             
-            return Response(
-                json.dumps({'success': True, 'recording_id': recording.id}),
-                content_type='application/json'
-            )
+            return self.json_response({'success': True, 'recording_id': recording.id})
         except Exception as e:
             _logger.exception("Error uploading recording: %s", str(e))
-            return Response(
-                json.dumps({'success': False, 'error': str(e)}),
-                content_type='application/json',
-                status=500
-            )
+            return self.json_response({'success': False, 'error': str(e)}, status=500)
 
     @http.route('/voip_webrtc_freepbx/save_recording', type='http', auth='user', methods=['POST'], csrf=False)
     def save_recording(self):
         """Save call recording to server"""
         try:
-            _logger.info('🔧 VoIP Controller Debug: ===== SAVE RECORDING START =====')
-            _logger.info('🔧 VoIP Controller Debug: User: %s', request.env.user.name)
-            _logger.info('🔧 VoIP Controller Debug: User ID: %s', request.env.user.id)
-            _logger.info('🔧 VoIP Controller Debug: Request method: %s', request.httprequest.method)
-            _logger.info('🔧 VoIP Controller Debug: Content type: %s', request.httprequest.content_type)
-            _logger.info('🔧 VoIP Controller Debug: Content length: %s', request.httprequest.content_length)
+            user = request.env.user
+            uid = user.id
+            debug = _logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                _logger.debug('🔧 VoIP Controller Debug: ===== SAVE RECORDING START =====')
+                _logger.debug('🔧 VoIP Controller Debug: User: %s', user.name)
+                _logger.debug('🔧 VoIP Controller Debug: User ID: %s', uid)
+                _logger.debug('🔧 VoIP Controller Debug: Request method: %s', request.httprequest.method)
+                _logger.debug('🔧 VoIP Controller Debug: Content type: %s', request.httprequest.content_type)
+                _logger.debug('🔧 VoIP Controller Debug: Content length: %s', request.httprequest.content_length)
             
             # Get uploaded file
             recording_file = request.httprequest.files.get('recording')
             call_id_str = request.httprequest.form.get('call_id', 'unknown')
             duration = int(request.httprequest.form.get('duration', 0))
             
-            _logger.info('🔧 VoIP Controller Debug: Call ID string: %s', call_id_str)
-            _logger.info('🔧 VoIP Controller Debug: Duration from request: %s seconds', duration)
-            _logger.info('🔧 VoIP Controller Debug: Recording file: %s', recording_file)
+            if debug:
+                _logger.debug('🔧 VoIP Controller Debug: Call ID string: %s', call_id_str)
+                _logger.debug('🔧 VoIP Controller Debug: Duration from request: %s seconds', duration)
+                _logger.debug('🔧 VoIP Controller Debug: Recording file: %s', recording_file)
             
             if not recording_file:
                 _logger.error('🔧 VoIP Controller Debug: No recording file provided')
-                return json.dumps({'error': 'No recording file provided'})
+                return self.json_response({'error': 'No recording file provided'})
             
-            _logger.info('🔧 VoIP Controller Debug: Recording file name: %s', recording_file.filename)
-            _logger.info('🔧 VoIP Controller Debug: Recording file size: %s bytes', len(recording_file.read()))
-            recording_file.seek(0)  # Reset file pointer
+            _logger.debug('🔧 VoIP Controller Debug: Recording file name: %s', recording_file.filename)
             
             # Handle call_id - it can be Odoo call ID, SIP Call ID, or "unknown"
             call_id = None
             call = None
             
             if call_id_str and call_id_str != 'unknown':
+                # Only the fields used below are fetched, in the lookup query itself
+                Call = request.env['voip.call']
+                call_fields = ['end_time', 'state', 'answer_time', 'duration']
+                
                 # First try to find by Odoo call ID (numeric)
-                try:
-                    call_id_int = int(call_id_str)
-                    call = request.env['voip.call'].browse(call_id_int)
-                    if call.exists():
+                if call_id_str.isdigit():
+                    call = Call.search_fetch([('id', '=', int(call_id_str))], call_fields, limit=1)
+                    if call:
                         call_id = call.id
-                        _logger.info('🔧 VoIP Controller Debug: Found call by Odoo ID: %s', call_id)
-                except (ValueError, TypeError):
-                    pass
+                        _logger.debug('🔧 VoIP Controller Debug: Found call by Odoo ID: %s', call_id)
                 
                 # If not found, try to find by SIP Call ID
                 if not call_id:
-                    call = request.env['voip.call'].search([
+                    call = Call.search_fetch([
                         ('call_id', '=', call_id_str)
-                    ], limit=1, order='create_date desc')
+                    ], call_fields, limit=1, order='create_date desc')
                     
                     if call:
                         call_id = call.id
-                        _logger.info('🔧 VoIP Controller Debug: Found call by SIP Call ID: %s -> %s', call_id_str, call_id)
+                        _logger.debug('🔧 VoIP Controller Debug: Found call by SIP Call ID: %s -> %s', call_id_str, call_id)
                     else:
                         _logger.warning('🔧 VoIP Controller Debug: No call found for SIP Call ID: %s', call_id_str)
             
             # If call found, update timing information if needed (especially for recordings saved after call ends)
-            if call and call.exists():
+            if call:
                 # Update end_time if not set
                 if not call.end_time:
                     call.write({'end_time': fields.Datetime.now()})
-                    _logger.info('🔧 VoIP Controller Debug: Updated call end_time from recording save')
+                    _logger.debug('🔧 VoIP Controller Debug: Updated call end_time from recording save')
                 
                 # Auto-update state if end_time exists but state is still 'ringing'
                 if call.end_time and call.state == 'ringing':
                     if call.answer_time:
                         call.write({'state': 'completed'})
-                        _logger.info('🔧 VoIP Controller Debug: Updated call state to completed')
+                        _logger.debug('🔧 VoIP Controller Debug: Updated call state to completed')
                     else:
                         call.write({'state': 'missed'})
-                        _logger.info('🔧 VoIP Controller Debug: Updated call state to missed')
+                        _logger.debug('🔧 VoIP Controller Debug: Updated call state to missed')
                 
                 # Don't set answer_time here - it should only be set when call is actually answered
                 # answer_time will be set when call state changes to 'in_progress' via update_call
@@ -196,93 +181,74 @@ class VoipRecordingController(VoipBaseController):
                 
                 if existing_recording:
                     recording = existing_recording
-                    _logger.info('🔧 VoIP Controller Debug: Found existing recording ID: %s for call ID: %s', recording.id, call_id)
+                    _logger.debug('🔧 VoIP Controller Debug: Found existing recording ID: %s for call ID: %s', recording.id, call_id)
                 else:
-                    _logger.info('🔧 VoIP Controller Debug: No existing recording found for call ID: %s, will create new one', call_id)
+                    _logger.debug('🔧 VoIP Controller Debug: No existing recording found for call ID: %s, will create new one', call_id)
             
             # If no call found, create a standalone recording
             if not call_id:
-                _logger.info('🔧 VoIP Controller Debug: Creating standalone recording without call reference')
+                _logger.debug('🔧 VoIP Controller Debug: Creating standalone recording without call reference')
                 call_id = None
             
             # Use duration from JavaScript (calculated from actual call time)
-            _logger.info('🔧 VoIP Controller Debug: Using duration from JavaScript: %s seconds', duration)
+            _logger.debug('🔧 VoIP Controller Debug: Using duration from JavaScript: %s seconds', duration)
+            
+            # Prepare recording data
+            prefix, label, key = ('call', 'Call', call_id) if call_id else ('standalone', 'Standalone', call_id_str)
+            recording_filename = f'{prefix}_recording_{key}_{time.time_ns()}.webm'
             
             # Read file data
             file_data = recording_file.read()
-            _logger.info('🔧 VoIP Controller Debug: File data size: %s bytes', len(file_data))
-            
-            # Encode to base64
-            attachment_data = base64.b64encode(file_data)
-            _logger.info('🔧 VoIP Controller Debug: Base64 data size: %s bytes', len(attachment_data))
-            
-            # Prepare recording data
-            if call_id:
-                recording_filename = f'call_recording_{call_id}_{int(time.time())}.webm'
-            else:
-                recording_filename = f'standalone_recording_{call_id_str}_{int(time.time())}.webm'
+            file_size = len(file_data)
+            _logger.debug('🔧 VoIP Controller Debug: File data size: %s bytes', file_size)
             
             # If recording exists, update it instead of creating new one
             if recording:
-                _logger.info('🔧 VoIP Controller Debug: Updating existing recording ID: %s', recording.id)
+                _logger.debug('🔧 VoIP Controller Debug: Updating existing recording ID: %s', recording.id)
                 recording.write({
-                    'recording_file': attachment_data,
                     'recording_filename': recording_filename,
-                    'file_size': len(file_data),
+                    'file_size': file_size,
                     'duration': duration,
                     'state': 'completed',
                 })
-                _logger.info('🔧 VoIP Controller Debug: Recording updated successfully')
+                _logger.debug('🔧 VoIP Controller Debug: Recording updated successfully')
             else:
                 # Create new recording record
+                recording_data = {
+                    'name': f'{label} Recording - {key}',
+                    'call_id': call_id or False,  # False for standalone recordings
+                    'duration': duration,
+                    'state': 'completed',  # Mark as completed since we have the file
+                    'user_id': uid,  # Set current user
+                    'recording_filename': recording_filename,
+                    'file_size': file_size,
+                    # caller/callee will be auto-populated by create() method
+                }
                 if call_id:
-                    recording_data = {
-                        'name': f'Call Recording - {call_id}',
-                        'call_id': call_id,
-                        'duration': duration,
-                        'state': 'completed',  # Mark as completed since we have the file
-                        'user_id': request.env.user.id,  # Set current user
-                        'recording_file': attachment_data,
-                        'recording_filename': recording_filename,
-                        'file_size': len(file_data),
-                        # caller/callee will be auto-populated by create() method
-                    }
-                    _logger.info('🔧 VoIP Controller Debug: Call duration (for reference): %s seconds', call.duration if call else 0)
+                    if debug:
+                        _logger.debug('🔧 VoIP Controller Debug: Call duration (for reference): %s seconds', call.duration if call else 0)
                 else:
-                    recording_data = {
-                        'name': f'Standalone Recording - {call_id_str}',
-                        'call_id': False,  # No call reference
-                        'duration': duration,
-                        'state': 'completed',  # Mark as completed since we have the file
-                        'user_id': request.env.user.id,  # Set current user
-                        'recording_file': attachment_data,
-                        'recording_filename': recording_filename,
-                        'file_size': len(file_data),
-                    }
-                    _logger.info('🔧 VoIP Controller Debug: Creating standalone recording')
-                
-                # _logger.info('🔧 VoIP Controller Debug: Recording data: %s', recording_data)
+                    _logger.debug('🔧 VoIP Controller Debug: Creating standalone recording')
                 
-                # Create recording record (attachment will be auto-created because attachment=True)
                 recording = request.env['voip.recording'].sudo().create(recording_data)
-                _logger.info('🔧 VoIP Controller Debug: Recording record created with ID: %s', recording.id)
+                _logger.debug('🔧 VoIP Controller Debug: Recording record created with ID: %s', recording.id)
+            
+            # Store the audio as-is in the field's attachment (no base64 round-trip)
+            recording._set_recording_file_raw(file_data, mimetype='audio/webm')
             
-            _logger.info('🔧 VoIP Controller Debug: Recording saved successfully')
-            _logger.info('🔧 VoIP Controller Debug: Final recording ID: %s', recording.id)
-            _logger.info('🔧 VoIP Controller Debug: File size: %s bytes', recording.file_size)
-            _logger.info('🔧 VoIP Controller Debug: ===== SAVE RECORDING END =====')
+            if debug:
+                _logger.debug('🔧 VoIP Controller Debug: Recording saved successfully')
+                _logger.debug('🔧 VoIP Controller Debug: Final recording ID: %s', recording.id)
+                _logger.debug('🔧 VoIP Controller Debug: File size: %s bytes', file_size)
+                _logger.debug('🔧 VoIP Controller Debug: ===== SAVE RECORDING END =====')
             
-            return json.dumps({
+            return self.json_response({
                 'success': True,
                 'recording_id': recording.id,
-                'file_size': recording.file_size,
+                'file_size': file_size,
                 'message': 'Recording saved successfully'
             })
             
         except Exception as e:
-            _logger.error('🔧 VoIP Controller Debug: ===== SAVE RECORDING ERROR =====')
-            _logger.error('🔧 VoIP Controller Debug: Error type: %s', type(e).__name__)
-            _logger.error('🔧 VoIP Controller Debug: Error message: %s', str(e))
-            _logger.error('🔧 VoIP Controller Debug: Error details: %s', repr(e))
-            _logger.error('🔧 VoIP Controller Debug: ===== END ERROR =====')
-            return json.dumps({'error': str(e)})
+            _logger.exception('🔧 VoIP Controller Debug: save_recording failed: %s', e)
+            return self.json_response({'error': str(e)})
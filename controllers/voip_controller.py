@@ -36,12 +36,23 @@ import logging
 import base64
 import time
 from ..utils.logging_utils import VoipLoggingUtils
+from ..utils.audio_utils import VoipAudioUtils, MELODY_FREQUENCIES
+from ..models.voip_event import _PEER_STATUS_MAP, _CHANNEL_STATE_MAP
 
 _logger = logging.getLogger(__name__)
 
+_PHONE_STRIP = str.maketrans('', '', ' -()\t')
+
 
 class VoipController(http.Controller):
 
+    # AMI event type -> handler method, called with (event_data, server_id)
+    _EVENT_HANDLERS = {
+        'PeerStatus': 'handle_peer_status_event',
+        'Newstate': 'handle_newstate_event',
+        'Newchannel': 'handle_newchannel_event',
+    }
+
     @http.route('/voip/test', type='json', auth='user', csrf=False)
     def test_endpoint(self, **kwargs):
         """Simple test endpoint to verify controller functionality"""
@@ -55,26 +66,28 @@ class VoipController(http.Controller):
     def get_voip_config(self, **kwargs):
         """Get VoIP configuration for current user"""
         try:
-            _logger.info("🔧 VoIP Config Debug: Starting get_voip_config")
-            _logger.info(f"🔧 VoIP Config Debug: User: {request.env.user.name} (ID: {request.env.user.id})")
+            debug = _logger.isEnabledFor(logging.INFO)
+            user = request.env.user
+            if debug:
+                _logger.info("🔧 VoIP Config Debug: Starting get_voip_config")
+                _logger.info("🔧 VoIP Config Debug: User: %s (ID: %s)", user.name, user.id)
             
             VoipLoggingUtils.log_if_enabled(
                 request.env, _logger, 'info', 
-                'Getting VoIP config for user %s', request.env.user.name
+                'Getting VoIP config for user %s', user.name
             )
             
-            user = request.env.user
-            _logger.info(f"🔧 VoIP Config Debug: Searching for VoIP user for user ID: {user.id}")
-            
-            voip_user = request.env['voip.user'].sudo().search([
+            # Fetch everything get_voip_config() reads up front (one query per model)
+            VoipUser = request.env['voip.user'].sudo()
+            voip_user = VoipUser.search_fetch([
                 ('user_id', '=', user.id),
                 ('active', '=', True)
-            ])
+            ], VoipUser._voip_config_fields, limit=1)
+            voip_user.server_id.fetch(VoipUser._voip_config_server_fields)
             
-            _logger.info(f"🔧 VoIP Config Debug: Found VoIP user: {voip_user.exists()}")
-            if voip_user:
-                _logger.info(f"🔧 VoIP Config Debug: VoIP user name: {voip_user.name}")
-                _logger.info(f"🔧 VoIP Config Debug: VoIP user server: {voip_user.server_id.name if voip_user.server_id else 'None'}")
+            if debug and voip_user:
+                _logger.info("🔧 VoIP Config Debug: VoIP user name: %s", voip_user.name)
+                _logger.info("🔧 VoIP Config Debug: VoIP user server: %s", voip_user.server_id.name or 'None')
             
             if not voip_user:
                 _logger.warning("🔧 VoIP Config Debug: No VoIP user found for current user")
@@ -82,31 +95,23 @@ class VoipController(http.Controller):
                     'error': 'No VoIP configuration found for current user'
                 }
             
-            _logger.info("🔧 VoIP Config Debug: Updating last login")
             # Update last login
             voip_user.update_last_login()
             
-            _logger.info("🔧 VoIP Config Debug: Getting VoIP config from user")
             config = voip_user.get_voip_config()
-            _logger.info(f"🔧 VoIP Config Debug: Config retrieved: {bool(config)}")
             
-            _logger.info("🔧 VoIP Config Debug: Getting logging config")
             # Add logging configuration
             logging_config = VoipLoggingUtils.get_js_logging_config(request.env, voip_user.server_id.id)
             config['logging'] = logging_config
-            _logger.info(f"🔧 VoIP Config Debug: Logging config added: {bool(logging_config)}")
             
-            _logger.info("🔧 VoIP Config Debug: Returning config successfully")
+            if debug:
+                _logger.info("🔧 VoIP Config Debug: Returning config successfully")
             return {
                 'success': True,
                 'config': config
             }
         except Exception as e:
-            _logger.error("🔧 VoIP Config Debug: Exception occurred")
-            _logger.error(f"🔧 VoIP Config Debug: Exception type: {type(e).__name__}")
-            _logger.error(f"🔧 VoIP Config Debug: Exception message: {str(e)}")
-            import traceback
-            _logger.error(f"🔧 VoIP Config Debug: Traceback: {traceback.format_exc()}")
+            _logger.exception("🔧 VoIP Config Debug: Exception occurred: %s", e)
             
             VoipLoggingUtils.log_if_enabled(
                 request.env, _logger, 'error', 
@@ -150,21 +155,16 @@ class VoipController(http.Controller):
             server = current_voip_user.server_id
             hold_music_list = []
             
-            # Parse hold music configuration from server
-            if server.hold_music_config:
-                try:
-                    import json
-                    music_config = json.loads(server.hold_music_config)
-                    for music in music_config.get('music_files', []):
-                        hold_music_list.append({
-                            'id': music.get('id'),
-                            'name': music.get('name'),
-                            'file_path': music.get('file_path'),
-                            'server': server.name,
-                            'server_id': server.id
-                        })
-                except (json.JSONDecodeError, KeyError) as e:
-                    _logger.warning(f"⚠️ Invalid hold music config: {str(e)}")
+            # Hold music configuration is parsed once when the server is saved
+            music_config = server.hold_music_parsed or {}
+            for music in music_config.get('music_files', []):
+                hold_music_list.append({
+                    'id': music.get('id'),
+                    'name': music.get('name'),
+                    'file_path': music.get('file_path'),
+                    'server': server.name,
+                    'server_id': server.id
+                })
             
             # Add default hold music if none configured
             if not hold_music_list:
@@ -176,7 +176,7 @@ class VoipController(http.Controller):
                     'server_id': server.id
                 })
             
-            _logger.info(f"🎵 Hold Music List: Found {len(hold_music_list)} music files")
+            _logger.info("🎵 Hold Music List: Found %s music files", len(hold_music_list))
             
             return {
                 'success': True,
@@ -185,7 +185,7 @@ class VoipController(http.Controller):
             }
             
         except Exception as e:
-            _logger.error(f"❌ Failed to get hold music list: {str(e)}")
+            _logger.error("❌ Failed to get hold music list: %s", e)
             return {
                 'success': False,
                 'error': str(e)
@@ -320,18 +320,8 @@ class VoipController(http.Controller):
              -d '{"event_type": "Newchannel", "timestamp": "2025-10-20T12:00:00", "data": {...}}'
         """
         try:
-            # Log incoming request
-            _logger.info("=" * 80)
-            _logger.info("🔔 FREEPBX WEBHOOK RECEIVED")
-            _logger.info("=" * 80)
-            _logger.info(f"📡 Remote IP: {request.httprequest.remote_addr}")
-            _logger.info(f"📡 Method: {request.httprequest.method}")
-            _logger.info(f"📡 Content-Type: {request.httprequest.content_type}")
-            _logger.info(f"📡 Content-Length: {request.httprequest.content_length}")
-
             # ===== API KEY AUTHENTICATION (Required) =====
             api_key = request.httprequest.headers.get('X-API-Key')
-            _logger.info(f"🔐 API Key: {'Present' if api_key else 'Missing'}")
 
             # API Key is required
             if not api_key:
@@ -357,19 +347,15 @@ class VoipController(http.Controller):
                     content_type='application/json'
                 )
 
-            _logger.info(f"✅ API Key validated - Server: {server.name} (ID: {server.id})")
-            
             # Store server_id in context for later use
             request.update_context(voip_server_id=server.id)
 
             # ===== PARSE REQUEST DATA =====
             try:
-                raw_data = request.httprequest.data.decode('utf-8')
-                _logger.info(f"📥 Raw data (first 500 chars): {raw_data[:500]}")
-
+                # Parsed from bytes; only a bounded slice is rendered for the log
+                raw_data = request.httprequest.data
                 data = json.loads(raw_data)
-                _logger.info(f"📦 Parsed JSON successfully")
-            except json.JSONDecodeError as e:
+            except ValueError as e:
                 _logger.error(f"❌ Invalid JSON: {e}")
                 return Response(
                     json.dumps({'success': False, 'error': 'Invalid JSON format'}),
@@ -379,17 +365,11 @@ class VoipController(http.Controller):
 
             # ===== EXTRACT EVENT DATA =====
             event_type = data.get('event_type', 'Unknown')
-            timestamp = data.get('timestamp')
             event_data = data.get('data', {})
 
-            _logger.info(f"📞 Event Type: {event_type}")
-            _logger.info(f"⏰ Timestamp: {timestamp}")
-            _logger.info(f"🖥️  Server: {server.name} (ID: {server.id})")
-            _logger.info(f"📊 Event Data: {json.dumps(event_data, indent=2)}")
-            
             # Save event to database for reporting
             try:
-                request.env['voip.event'].sudo().create_from_webhook(event_data, server.id)
+                request.env['voip.event'].sudo().create_from_webhook(data, server.id)
             except Exception as e:
                 _logger.warning(f"⚠️ Failed to save event to database: {str(e)}")
 
@@ -397,56 +377,20 @@ class VoipController(http.Controller):
             # Extract common call information
             channel = event_data.get('Channel', 'N/A')
             caller_id = event_data.get('CallerIDNum', 'N/A')
-            caller_name = event_data.get('CallerIDName', 'N/A')
-            exten = event_data.get('Exten', 'N/A')
-            context = event_data.get('Context', 'N/A')
             uniqueid = event_data.get('Uniqueid', 'N/A')
 
-            _logger.info(f"📞 Call Details:")
-            _logger.info(f"   - Channel: {channel}")
-            _logger.info(f"   - Caller ID: {caller_id} ({caller_name})")
-            _logger.info(f"   - Extension: {exten}")
-            _logger.info(f"   - Context: {context}")
-            _logger.info(f"   - Unique ID: {uniqueid}")
-
             # ===== YOUR BUSINESS LOGIC HERE =====
             # Process different event types
-            if event_type == 'Newchannel':
-                _logger.info("📞 Processing New Channel event...")
-                # TODO: Create call record, update CRM, etc.
-
-            elif event_type == 'Hangup':
-                _logger.info("📞 Processing Hangup event...")
-                # TODO: Update call duration, status, etc.
-
-            elif event_type == 'Dial':
-                _logger.info("📞 Processing Dial event...")
-                # TODO: Track outgoing calls, update contact, etc.
-
-            elif event_type == 'Bridge':
-                _logger.info("📞 Processing Bridge event...")
-                # TODO: Track call connections, conference, etc.
-
-            elif event_type == 'PeerStatus':
-                _logger.info("📞 Processing PeerStatus event...")
-                self.handle_peer_status_event(event_data, server.id)
-
-            elif event_type == 'Newstate':
-                _logger.info("📞 Processing Newstate event...")
-                self.handle_newstate_event(event_data, server.id)
-
-            elif event_type == 'Newchannel':
-                _logger.info("📞 Processing Newchannel event...")
-                self.handle_newchannel_event(event_data, server.id)
-
-            else:
-                _logger.info(f"📞 Event {event_type} received (no specific handler)")
+            # TODO: Hangup (call duration, status), Dial (outgoing calls), Bridge (call connections)
+            handler = self._EVENT_HANDLERS.get(event_type)
+            if handler:
+                getattr(self, handler)(event_data, server.id)
 
             # ===== EXAMPLE: Search for contact by phone =====
             if caller_id and caller_id != 'N/A':
                 Partner = request.env['res.partner'].sudo()
                 # Clean phone number (remove spaces, dashes, etc.)
-                clean_phone = caller_id.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
+                clean_phone = caller_id.translate(_PHONE_STRIP)
 
                 partners = Partner.search([
                     '|', '|',
@@ -463,8 +407,18 @@ class VoipController(http.Controller):
                     # TODO: Create notification for new contact, etc.
 
             # ===== SUCCESS RESPONSE =====
-            _logger.info("✅ Event processed successfully!")
-            _logger.info("=" * 80)
+            # One record per webhook; structured fields for JSON log handlers
+            _logger.info(
+                "📞 %s event from %s processed", event_type, server.name,
+                extra={'voip': {
+                    'remote_ip': request.httprequest.remote_addr,
+                    'server_id': server.id,
+                    'event_type': event_type,
+                    'channel': channel,
+                    'uniqueid': uniqueid,
+                    'caller_id': caller_id,
+                }},
+            )
 
             return Response(
                 json.dumps({
@@ -481,7 +435,6 @@ class VoipController(http.Controller):
 
         except Exception as e:
             _logger.exception("❌ ERROR in FreePBX Webhook")
-            _logger.error("=" * 80)
             return Response(
                 json.dumps({
                     'success': False,
@@ -972,34 +925,21 @@ class VoipController(http.Controller):
     def fix_corrupted_music_files(self):
         """Fix corrupted music files by regenerating them"""
         try:
-            # Find music files with corrupted data
+            # Only files whose stored RIFF/WAVE header check failed are
+            # regenerated; errors while scanning never trigger a rewrite
             corrupted_music = request.env['voip.hold.music'].search([
                 ('active', '=', True),
-                ('music_file', '!=', False)
+                ('checksum', '!=', False),
+                ('music_file_valid', '=', False),
             ])
             
             for music in corrupted_music:
+                _logger.info("Regenerating corrupted music file: %s", music.name)
                 try:
-                    # Check if record still exists
-                    if not music.exists():
-                        _logger.warning(f"Music record {music.id} no longer exists, skipping...")
-                        continue
-                    
-                    # Try to decode the base64 data
-                    import base64
-                    music_data = base64.b64decode(music.music_file)
-                    
-                    # Check if it's a valid WAV file
-                    if not music_data.startswith(b'RIFF') or not b'WAVE' in music_data[:12]:
-                        _logger.info(f"Regenerating corrupted music file: {music.name}")
+                    with request.env.cr.savepoint():
                         self.regenerate_music_file(music)
-                        
-                except Exception as e:
-                    _logger.warning(f"Music file {music.name} is corrupted, regenerating...")
-                    try:
-                        self.regenerate_music_file(music)
-                    except Exception as regen_error:
-                        _logger.error(f"Failed to regenerate music file {music.name}: {regen_error}")
+                except Exception as regen_error:
+                    _logger.error("Failed to regenerate music file %s: %s", music.name, regen_error)
                     
         except Exception as e:
             _logger.exception("Error fixing corrupted music files: %s", str(e))
@@ -1087,63 +1027,10 @@ class VoipController(http.Controller):
     def create_valid_music_file(self, music_record):
         """Create a valid music file for testing"""
         try:
-            import base64
-            import io
-            import wave
-            import math
-            
-            # Create a simple but pleasant melody
-            sample_rate = 44100
-            duration = 10  # 10 seconds
-            buffer = io.BytesIO()
-            
-            with wave.open(buffer, 'wb') as wav_file:
-                wav_file.setnchannels(1)  # Mono
-                wav_file.setsampwidth(2)  # 16-bit
-                wav_file.setframerate(sample_rate)
-                
-                # Create a simple melody
-                melody_notes = [
-                    (440, 1),    # A4
-                    (523.25, 1), # C5
-                    (659.25, 1), # E5
-                    (783.99, 1), # G5
-                    (659.25, 1), # E5
-                    (523.25, 1), # C5
-                    (440, 1),    # A4
-                    (392, 1),    # G4
-                ]
-                
-                total_samples = int(sample_rate * duration)
-                samples = []
-                sample_index = 0
-                
-                for note_freq, note_duration in melody_notes:
-                    note_samples = int(sample_rate * note_duration)
-                    end_index = min(sample_index + note_samples, total_samples)
-                    
-                    for i in range(sample_index, end_index):
-                        time = (i - sample_index) / sample_rate
-                        # Create a pleasant tone
-                        sample = math.sin(2 * math.pi * note_freq * time) * 0.1
-                        
-                        # Convert to 16-bit PCM (little-endian)
-                        pcm_sample = int(max(-32768, min(32767, sample * 32767)))
-                        # Convert to bytes (little-endian)
-                        samples.append(pcm_sample & 0xFF)  # Low byte
-                        samples.append((pcm_sample >> 8) & 0xFF)  # High byte
-                    
-                    sample_index = end_index
-                    
-                    # If we've filled the duration, break
-                    if sample_index >= total_samples:
-                        break
-                
-                # Write the samples
-                wav_file.writeframes(bytes(samples))
-            
-            wav_data = buffer.getvalue()
-            wav_base64 = base64.b64encode(wav_data).decode('utf-8')
+            # Simple one-second notes, each starting at phase zero
+            wav_data, wav_base64 = VoipAudioUtils.get_melody_wav(
+                [(freq, 1) for freq in MELODY_FREQUENCIES], 10, restart_phase=True
+            )
             
             # Update the music record
             music_record.write({
@@ -1206,17 +1093,8 @@ class VoipController(http.Controller):
             
             # Map PeerStatus to user status
             old_status = voip_user.status
-            new_status = old_status
-            
-            if peer_status == 'Reachable':
-                new_status = 'available'
-            elif peer_status == 'Unreachable':
-                new_status = 'offline'
-            elif peer_status == 'Lagged':
-                new_status = 'away'
-            elif peer_status == 'Busy':
-                new_status = 'busy'
-            else:
+            new_status = _PEER_STATUS_MAP.get(peer_status)
+            if new_status is None:
                 _logger.info(f"🔔 Unknown peer status: {peer_status}, keeping current status")
                 return
             
@@ -1276,23 +1154,8 @@ class VoipController(http.Controller):
             
             # Map ChannelState to user status
             old_status = voip_user.status
-            new_status = old_status
-            
-            if channel_state == '4':  # Ring
-                new_status = 'busy'
-            elif channel_state == '6':  # Up (Connected)
-                new_status = 'busy'
-            elif channel_state == '0':  # Down (Hangup)
-                new_status = 'available'
-            elif channel_state == '1':  # Reserved
-                new_status = 'busy'
-            elif channel_state == '2':  # OffHook
-                new_status = 'busy'
-            elif channel_state == '3':  # Dialing
-                new_status = 'busy'
-            elif channel_state == '5':  # Busy
-                new_status = 'busy'
-            else:
+            new_status = _CHANNEL_STATE_MAP.get(channel_state)
+            if new_status is None:
                 _logger.info(f"🔔 Unknown channel state: {channel_state}, keeping current status")
                 return
             
@@ -30,12 +30,51 @@
 #################################################################################
 from odoo import http
 from odoo.http import request, Response
-import json
 import logging
-from .base_controller import VoipBaseController
+from .base_controller import VoipBaseController, json_dumps, json_loads
 
 _logger = logging.getLogger(__name__)
 
+# Largest webhook body accepted; AMI events are a few KB at most
+MAX_WEBHOOK_BYTES = 1024 * 1024
+
+# /voip/webhook/notification call events -> voip.user status
+_CALL_EVENT_STATUS_MAP = {
+    'call_start': 'busy',
+    'call_ringing': 'busy',
+    'call_connected': 'busy',
+    'call_end': 'available',
+    'call_hangup': 'available',
+    'call_completed': 'available',
+}
+
+# /voip/webhook/notification presence events -> voip.user status
+_PRESENCE_EVENT_STATUS_MAP = {
+    'user_online': 'available',
+    'user_offline': 'offline',
+}
+
+
+# Fixed error replies, serialized and encoded once at import
+_ERROR_BODIES = {
+    status: json_dumps({'success': False, 'error': error}).encode()
+    for status, error in [
+        (400, 'Invalid JSON format'),
+        (401, 'API key required'),
+        (403, 'Invalid API key - Server not found'),
+        (413, 'Payload too large'),
+    ]
+}
+
+
+# Content types of newline-delimited JSON batches
+_JSONL_MIMETYPES = {'application/jsonl', 'application/x-ndjson', 'application/x-jsonlines'}
+
+
+def _error_response(status):
+    """Return the pre-serialized error reply for status"""
+    return Response(_ERROR_BODIES[status], status=status, content_type='application/json')
+
 
 class VoipWebhookController(VoipBaseController):
     """Controller for managing webhook events and notifications"""
@@ -72,435 +111,214 @@ class VoipWebhookController(VoipBaseController):
              -d '{"event_type": "Newchannel", "timestamp": "2025-10-20T12:00:00", "data": {...}}'
         """
         try:
-            # Log incoming request
-            _logger.info("=" * 80)
-            _logger.info("🔔 FREEPBX WEBHOOK RECEIVED")
-            _logger.info("=" * 80)
-            _logger.info(f"📡 Remote IP: {request.httprequest.remote_addr}")
-            _logger.info(f"📡 Method: {request.httprequest.method}")
-            _logger.info(f"📡 Content-Type: {request.httprequest.content_type}")
-            _logger.info(f"📡 Content-Length: {request.httprequest.content_length}")
-
             # ===== API KEY AUTHENTICATION (Required) =====
-            api_key = request.httprequest.headers.get('X-API-Key')
-            _logger.info(f"🔐 API Key: {'Present' if api_key else 'Missing'}")
-
-            # API Key is required
-            if not api_key:
-                _logger.warning("⚠️  API Key missing!")
-                return Response(
-                    json.dumps({'success': False, 'error': 'API key required'}),
-                    status=401,
-                    content_type='application/json'
-                )
+            # Checked first: rejected requests cost one cached lookup and a
+            # pre-serialized reply, nothing else
+            server_id, server_name, error = self._authenticate_webhook()
+            if error:
+                return error
 
-            # Search for VoIP server by API key
-            VoipServer = request.env['voip.server'].sudo()
-            server = VoipServer.search([
-                ('api_key', '=', api_key),
-                ('active', '=', True)
-            ], limit=1)
-
-            if not server:
-                _logger.warning(f"❌ Invalid API key from {request.httprequest.remote_addr}")
-                return Response(
-                    json.dumps({'success': False, 'error': 'Invalid API key - Server not found'}),
-                    status=403,
-                    content_type='application/json'
-                )
+            debug = _logger.isEnabledFor(logging.DEBUG)
+            httprequest = request.httprequest
 
-            _logger.info(f"✅ API Key validated - Server: {server.name} (ID: {server.id})")
-            
-            # Store server_id in context for later use
-            request.update_context(voip_server_id=server.id)
+            # Log incoming request
+            if debug:
+                _logger.debug(
+                    "🔔 FreePBX webhook from %s: %s %s, %s bytes",
+                    httprequest.remote_addr, httprequest.method,
+                    httprequest.content_type, httprequest.content_length,
+                )
 
             # ===== PARSE REQUEST DATA =====
+            # Reject oversized payloads before the body is read into memory
+            if (httprequest.content_length or 0) > MAX_WEBHOOK_BYTES:
+                _logger.warning("❌ Webhook payload too large: %s bytes", httprequest.content_length)
+                return _error_response(413)
+
             try:
-                raw_data = request.httprequest.data.decode('utf-8')
-                _logger.info(f"📥 Raw data (first 500 chars): {raw_data[:500]}")
-
-                data = json.loads(raw_data)
-                _logger.info(f"📦 Parsed JSON successfully")
-            except json.JSONDecodeError as e:
-                _logger.error(f"❌ Invalid JSON: {e}")
-                return Response(
-                    json.dumps({'success': False, 'error': 'Invalid JSON format'}),
-                    status=400,
-                    content_type='application/json'
-                )
+                raw_data = httprequest.data
+                if debug:
+                    _logger.debug("📥 Raw data (first 500 bytes): %r", raw_data[:500])
+
+                data = json_loads(raw_data)
+            except ValueError as e:
+                _logger.error("❌ Invalid JSON: %s", e)
+                return _error_response(400)
 
             # ===== EXTRACT EVENT DATA =====
             event_type = data.get('event_type', 'Unknown')
             timestamp = data.get('timestamp')
             event_data = data.get('data', {})
 
-            _logger.info(f"📞 Event Type: {event_type}")
-            _logger.info(f"⏰ Timestamp: {timestamp}")
-            _logger.info(f"🖥️  Server: {server.name} (ID: {server.id})")
-            _logger.info(f"📊 Event Data: {json.dumps(event_data, indent=2)}")
+            if debug:
+                _logger.debug("📊 Event Data (%s): %r", timestamp, event_data)
             
-            # Save event to database for reporting
-            try:
-                request.env['voip.event'].sudo().create_from_webhook(event_data, server.id)
-            except Exception as e:
-                _logger.warning(f"⚠️ Failed to save event to database: {str(e)}")
-
-            # ===== PROCESS EVENT =====
-            # Extract common call information
-            channel = event_data.get('Channel', 'N/A')
-            caller_id = event_data.get('CallerIDNum', 'N/A')
-            caller_name = event_data.get('CallerIDName', 'N/A')
-            exten = event_data.get('Exten', 'N/A')
-            context = event_data.get('Context', 'N/A')
-            uniqueid = event_data.get('Uniqueid', 'N/A')
-
-            _logger.info(f"📞 Call Details:")
-            _logger.info(f"   - Channel: {channel}")
-            _logger.info(f"   - Caller ID: {caller_id} ({caller_name})")
-            _logger.info(f"   - Extension: {exten}")
-            _logger.info(f"   - Context: {context}")
-            _logger.info(f"   - Unique ID: {uniqueid}")
-
-            # ===== YOUR BUSINESS LOGIC HERE =====
-            # Process different event types
-            if event_type == 'Newchannel':
-                _logger.info("📞 Processing New Channel event...")
-                # TODO: Create call record, update CRM, etc.
-
-            elif event_type == 'Hangup':
-                _logger.info("📞 Processing Hangup event...")
-                # TODO: Update call duration, status, etc.
-
-            elif event_type == 'Dial':
-                _logger.info("📞 Processing Dial event...")
-                # TODO: Track outgoing calls, update contact, etc.
-
-            elif event_type == 'Bridge':
-                _logger.info("📞 Processing Bridge event...")
-                # TODO: Track call connections, conference, etc.
-
-            elif event_type == 'PeerStatus':
-                _logger.info("📞 Processing PeerStatus event...")
-                self.handle_peer_status_event(event_data, server.id)
-
-            elif event_type == 'Newstate':
-                _logger.info("📞 Processing Newstate event...")
-                self.handle_newstate_event(event_data, server.id)
-
-            elif event_type == 'Newchannel':
-                _logger.info("📞 Processing Newchannel event...")
-                self.handle_newchannel_event(event_data, server.id)
-
-            else:
-                _logger.info(f"📞 Event {event_type} received (no specific handler)")
-
-            # ===== EXAMPLE: Search for contact by phone =====
-            if caller_id and caller_id != 'N/A':
-                Partner = request.env['res.partner'].sudo()
-                # Clean phone number (remove spaces, dashes, etc.)
-                clean_phone = caller_id.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
-
-                partners = Partner.search([
-                    '|', '|',
-                    ('phone', 'ilike', clean_phone),
-                    ('mobile', 'ilike', clean_phone),
-                    ('phone', 'ilike', caller_id)
-                ], limit=1)
-
-                if partners:
-                    _logger.info(f"👤 Found contact: {partners[0].name} (ID: {partners[0].id})")
-                    # TODO: Update contact activity, create call log, etc.
-                else:
-                    _logger.info(f"👤 No contact found for: {caller_id}")
-                    # TODO: Create notification for new contact, etc.
+            # ===== QUEUE EVENT =====
+            # Acknowledged once the event is committed to the queue; the
+            # webhook queue cron stores and handles it
+            request.env['voip.webhook.queue'].sudo()._enqueue([data], server_id)
 
             # ===== SUCCESS RESPONSE =====
-            _logger.info("✅ Event processed successfully!")
-            _logger.info("=" * 80)
-
-            return Response(
-                json.dumps({
-                    'success': True,
-                    'message': 'Event received and processed',
-                    'server_id': server.id,
-                    'server_name': server.name,
+            # One record per webhook; structured fields for JSON log handlers
+            _logger.info(
+                "📞 %s event from %s queued", event_type, server_name,
+                extra={'voip': {
+                    'remote_ip': httprequest.remote_addr,
+                    'server_id': server_id,
                     'event_type': event_type,
-                    'uniqueid': uniqueid
-                }),
-                status=200,
-                content_type='application/json'
+                    'channel': event_data.get('Channel'),
+                    'uniqueid': event_data.get('Uniqueid'),
+                    'caller_id': event_data.get('CallerIDNum'),
+                }},
             )
 
+            return self.json_response({
+                'success': True,
+                'message': 'Event received',
+                'server_id': server_id,
+                'server_name': server_name,
+                'event_type': event_type,
+                'uniqueid': event_data.get('Uniqueid', 'N/A')
+            }, status=202)
+
         except Exception as e:
             _logger.exception("❌ ERROR in FreePBX Webhook")
-            _logger.error("=" * 80)
-            return Response(
-                json.dumps({
-                    'success': False,
-                    'error': str(e)
-                }),
-                status=500,
-                content_type='application/json'
-            )
+            return self.json_response({
+                'success': False,
+                'error': str(e)
+            }, status=500)
+
+    def _authenticate_webhook(self):
+        """Check the X-API-Key header of the current request
 
-    def handle_peer_status_event(self, event_data, server_id):
-        """Handle PeerStatus events to update user status
-        Note: Uses sudo() for webhook access to voip.user records
+        Returns (server_id, server_name, error) where error is the response
+        to send back when the key is missing or unknown, None otherwise.
         """
-        try:
-            _logger.info("🔔 Processing PeerStatus event...")
-            
-            # Extract peer information
-            peer = event_data.get('Peer', '')
-            peer_status = event_data.get('PeerStatus', '')
-            channel_type = event_data.get('ChannelType', '')
-            
-            _logger.info(f"🔔 Peer: {peer}, Status: {peer_status}, Type: {channel_type}")
-            
-            if not peer or not peer_status:
-                _logger.warning("🔔 Missing peer or status information")
-                return
-            
-            # Extract extension from peer (e.g., "PJSIP/200" -> "200")
-            extension = peer.replace('PJSIP/', '').replace('SIP/', '').strip()
-            
-            if not extension:
-                _logger.warning(f"🔔 Could not extract extension from peer: {peer}")
-                return
-            
-            _logger.info(f"🔔 Extracted extension: {extension}")
-            
-            # Find user by extension or SIP username
-            voip_user = request.env['voip.user'].sudo().search([
-                '|',
-                ('extension', '=', extension),
-                ('sip_username', '=', extension),
-                ('sip_username', 'ilike', f'%{extension}%')
-            ], limit=1)
-            
-            if not voip_user:
-                _logger.warning(f"🔔 User not found for extension: {extension}")
-                return
-            
-            # Map PeerStatus to user status
-            old_status = voip_user.status
-            new_status = old_status
-            
-            if peer_status == 'Reachable':
-                new_status = 'available'
-            elif peer_status == 'Unreachable':
-                new_status = 'offline'
-            elif peer_status == 'Lagged':
-                new_status = 'away'
-            elif peer_status == 'Busy':
-                new_status = 'busy'
-            else:
-                _logger.info(f"🔔 Unknown peer status: {peer_status}, keeping current status")
-                return
-            
-            # Update user status if changed
-            if new_status != old_status:
-                voip_user.write({'status': new_status})
-                _logger.info(f"🔔 User {voip_user.name} status updated: {old_status} → {new_status}")
-                
-                # Log the change
-                _logger.info(f"🔔 User status change: {voip_user.name} ({voip_user.sip_username}) - {old_status} → {new_status} (Peer: {peer})")
-            else:
-                _logger.info(f"🔔 User {voip_user.name} status unchanged: {old_status}")
-            
-        except Exception as e:
-            _logger.exception("Error handling PeerStatus event: %s", str(e))
+        httprequest = request.httprequest
+        api_key = httprequest.headers.get('X-API-Key')
+        _logger.debug("🔐 API Key: %s", 'Present' if api_key else 'Missing')
+
+        # API Key is required
+        if not api_key:
+            _logger.warning("⚠️  API Key missing!")
+            return False, False, _error_response(401)
+
+        # Search for VoIP server by API key
+        server_id, server_name = request.env['voip.server'].sudo()._get_server_by_api_key(api_key)
+
+        if not server_id:
+            _logger.warning("❌ Invalid API key from %s", httprequest.remote_addr)
+            return False, False, _error_response(403)
+
+        _logger.debug("✅ API Key validated - Server: %s (ID: %s)", server_name, server_id)
 
-    def handle_newstate_event(self, event_data, server_id):
-        """Handle Newstate events to update user status during calls
-        Note: Uses sudo() for webhook access to voip.user records
+        # Store server_id in context for later use
+        request.update_context(voip_server_id=server_id)
+        return server_id, server_name, None
+
+    @http.route('/pbx/webhook/batch', type='http', auth='public', methods=['POST'], csrf=False)
+    def pbx_webhook_batch(self, **kwargs):
         """
-        try:
-            _logger.info("🔔 Processing Newstate event...")
-            
-            # Extract call information
-            channel = event_data.get('Channel', '')
-            channel_state = event_data.get('ChannelState', '')
-            channel_state_desc = event_data.get('ChannelStateDesc', '')
-            caller_id = event_data.get('CallerIDNum', '')
-            context = event_data.get('Context', '')
-            
-            _logger.info(f"🔔 Channel: {channel}, State: {channel_state} ({channel_state_desc})")
-            
-            if not channel or not channel_state:
-                _logger.warning("🔔 Missing channel or state information")
-                return
-            
-            # Extract extension from channel (e.g., "PJSIP/200-00000001" -> "200")
-            extension = channel.split('/')[1].split('-')[0] if '/' in channel else channel
-            
-            if not extension:
-                _logger.warning(f"🔔 Could not extract extension from channel: {channel}")
-                return
-            
-            _logger.info(f"🔔 Extracted extension: {extension}")
-            
-            # Find user by extension or SIP username
-            voip_user = request.env['voip.user'].sudo().search([
-                '|',
-                ('extension', '=', extension),
-                ('sip_username', '=', extension),
-                ('sip_username', 'ilike', f'%{extension}%')
-            ], limit=1)
-            
-            if not voip_user:
-                _logger.warning(f"🔔 User not found for extension: {extension}")
-                return
-            
-            # Map ChannelState to user status
-            old_status = voip_user.status
-            new_status = old_status
-            
-            if channel_state == '4':  # Ring
-                new_status = 'busy'
-            elif channel_state == '6':  # Up (Connected)
-                new_status = 'busy'
-            elif channel_state == '0':  # Down (Hangup)
-                new_status = 'available'
-            elif channel_state == '1':  # Reserved
-                new_status = 'busy'
-            elif channel_state == '2':  # OffHook
-                new_status = 'busy'
-            elif channel_state == '3':  # Dialing
-                new_status = 'busy'
-            elif channel_state == '5':  # Busy
-                new_status = 'busy'
-            else:
-                _logger.info(f"🔔 Unknown channel state: {channel_state}, keeping current status")
-                return
-            
-            # Update user status if changed
-            if new_status != old_status:
-                voip_user.write({'status': new_status})
-                _logger.info(f"🔔 User {voip_user.name} status updated: {old_status} → {new_status}")
-                
-                # Log the change
-                _logger.info(f"🔔 User status change: {voip_user.name} ({voip_user.sip_username}) - {old_status} → {new_status} (Channel: {channel}, State: {channel_state})")
-            else:
-                _logger.info(f"🔔 User {voip_user.name} status unchanged: {old_status}")
-            
-        except Exception as e:
-            _logger.exception("Error handling Newstate event: %s", str(e))
+        Receive several FreePBX AMI events in one request
 
-    def handle_newchannel_event(self, event_data, server_id):
-        """Handle Newchannel events to update user status when calls start
-        Note: Uses sudo() for webhook access to voip.user records
+        Authentication is the same as /pbx/webhook (X-API-Key header). The
+        body is a JSON array of /pbx/webhook payloads or, with Content-Type
+        application/jsonl, one payload per line. The events are queued with
+        one INSERT and answered with 202 Accepted, then stored and handled
+        by the webhook queue cron; batches of about 50 events work well.
+
+        Example curl command:
+        curl -X POST https://your-odoo-domain/pbx/webhook/batch \\
+             -H "Content-Type: application/json" \\
+             -H "X-API-Key: your-server-api-key" \\
+             -d '[{"event_type": "Newchannel", "data": {...}}, {"event_type": "Newstate", "data": {...}}]'
         """
         try:
-            _logger.info("🔔 Processing Newchannel event...")
-            
-            # Extract channel information
-            channel = event_data.get('Channel', '')
-            channel_state = event_data.get('ChannelState', '')
-            caller_id = event_data.get('CallerIDNum', '')
-            context = event_data.get('Context', '')
-            unique_id = event_data.get('Uniqueid', '')
-            
-            _logger.info(f"🔔 Channel: {channel}, State: {channel_state}, Caller: {caller_id}")
-            
-            if not channel:
-                _logger.warning("🔔 Missing channel information")
-                return
-            
-            # Extract extension from channel (e.g., "PJSIP/200-00000001" -> "200")
-            extension = channel.split('/')[1].split('-')[0] if '/' in channel else channel
-            
-            if not extension:
-                _logger.warning(f"🔔 Could not extract extension from channel: {channel}")
-                return
-            
-            _logger.info(f"🔔 Extracted extension: {extension}")
-            
-            # Find user by extension or SIP username
-            voip_user = request.env['voip.user'].sudo().search([
-                '|',
-                ('extension', '=', extension),
-                ('sip_username', '=', extension),
-                ('sip_username', 'ilike', f'%{extension}%')
-            ], limit=1)
-            
-            if not voip_user:
-                _logger.warning(f"🔔 User not found for extension: {extension}")
-                return
-            
-            # Update user status to busy when new channel is created
-            old_status = voip_user.status
-            new_status = 'busy'  # New channel means user is busy
-            
-            if new_status != old_status:
-                voip_user.write({'status': new_status})
-                _logger.info(f"🔔 User {voip_user.name} status updated: {old_status} → {new_status}")
-                
-                # Log the change
-                _logger.info(f"🔔 User status change: {voip_user.name} ({voip_user.sip_username}) - {old_status} → {new_status} (Channel: {channel})")
-            else:
-                _logger.info(f"🔔 User {voip_user.name} status unchanged: {old_status}")
-            
+            httprequest = request.httprequest
+            server_id, server_name, error = self._authenticate_webhook()
+            if error:
+                return error
+
+            if (httprequest.content_length or 0) > MAX_WEBHOOK_BYTES:
+                _logger.warning("❌ Webhook payload too large: %s bytes", httprequest.content_length)
+                return _error_response(413)
+
+            try:
+                raw_data = httprequest.data
+                if httprequest.mimetype in _JSONL_MIMETYPES:
+                    payloads = [json_loads(line) for line in raw_data.splitlines() if line.strip()]
+                else:
+                    payloads = json_loads(raw_data)
+                if not isinstance(payloads, list) or not all(isinstance(data, dict) for data in payloads):
+                    raise ValueError("expected a list of event objects")
+            except ValueError as e:
+                _logger.error("❌ Invalid JSON batch: %s", e)
+                return _error_response(400)
+
+            # Queued with one INSERT, handled by the webhook queue cron
+            request.env['voip.webhook.queue'].sudo()._enqueue(payloads, server_id)
+
+            _logger.info("📦 Webhook batch from %s: %s events queued", server_name, len(payloads))
+
+            return self.json_response({
+                'success': True,
+                'message': 'Events received',
+                'server_id': server_id,
+                'server_name': server_name,
+                'received': len(payloads),
+            }, status=202)
+
         except Exception as e:
-            _logger.exception("Error handling Newchannel event: %s", str(e))
+            _logger.exception("❌ ERROR in FreePBX Webhook batch")
+            return self.json_response({
+                'success': False,
+                'error': str(e)
+            }, status=500)
 
     @http.route('/voip/webhook/notification', type='json', auth='none', methods=['POST'], csrf=False)
     def handle_webhook_notification(self, **kwargs):
         """Handle webhook notifications to update user status"""
         try:
-            _logger.info("🔔 Webhook notification received")
+            _logger.debug("🔔 Webhook notification received")
             
             # Get notification data
             notification_data = request.jsonrequest or {}
-            _logger.info(f"🔔 Notification data: {notification_data}")
+            _logger.debug("🔔 Notification data: %s", notification_data)
             
             # Extract user information
             user_extension = notification_data.get('extension') or notification_data.get('user')
             user_status = notification_data.get('status') or notification_data.get('state')
             event_type = notification_data.get('event') or notification_data.get('type')
             
-            _logger.info(f"🔔 User: {user_extension}, Status: {user_status}, Event: {event_type}")
+            _logger.debug("🔔 User: %s, Status: %s, Event: %s", user_extension, user_status, event_type)
             
             if not user_extension:
                 _logger.warning("🔔 No user extension found in notification")
                 return {'success': False, 'error': 'No user extension provided'}
             
             # Find user by SIP username or extension
-            voip_user = request.env['voip.user'].sudo().search([
-                '|',
-                ('sip_username', '=', user_extension),
-                ('extension', '=', user_extension)
-            ], limit=1)
+            voip_user = request.env['voip.user'].sudo()._get_user_by_extension(str(user_extension))
             
             if not voip_user:
-                _logger.warning(f"🔔 User not found for extension: {user_extension}")
+                _logger.warning("🔔 User not found for extension: %s", user_extension)
                 return {'success': False, 'error': f'User not found for extension: {user_extension}'}
             
             # Update user status based on event type
+            # Call events win over the status sent along, presence events don't
             old_status = voip_user.status
-            new_status = old_status
-            
-            if event_type in ['call_start', 'call_ringing', 'call_connected']:
-                new_status = 'busy'
-            elif event_type in ['call_end', 'call_hangup', 'call_completed']:
-                new_status = 'available'
-            elif user_status:
-                # Use status from notification if provided
-                new_status = user_status
-            elif event_type == 'user_online':
-                new_status = 'available'
-            elif event_type == 'user_offline':
-                new_status = 'offline'
+            new_status = (
+                _CALL_EVENT_STATUS_MAP.get(event_type)
+                or user_status
+                or _PRESENCE_EVENT_STATUS_MAP.get(event_type)
+                or old_status
+            )
             
             # Update user status if changed
             if new_status != old_status:
-                voip_user.write({'status': new_status})
-                _logger.info(f"🔔 User {voip_user.name} status updated: {old_status} → {new_status}")
-                
-                # Log the change
-                _logger.info(f"🔔 User status change: {voip_user.name} ({voip_user.sip_username}) - {old_status} → {new_status}")
+                voip_user._set_status(new_status)
+                _logger.info("🔔 User status change: %s (%s) - %s → %s", voip_user.name, voip_user.sip_username, old_status, new_status)
             else:
-                _logger.info(f"🔔 User {voip_user.name} status unchanged: {old_status}")
+                _logger.debug("🔔 User %s status unchanged: %s", voip_user.name, old_status)
             
             return {
                 'success': True,
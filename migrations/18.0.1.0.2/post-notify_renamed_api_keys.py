@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#################################################################################
+#
+# Module Name: Voip Webrtc Freepbx
+# Description: Establishes real-time VoIP communication between Odoo and FreePBX 
+#              using WebRTC and PJSIP for seamless browser-based calling integration.
+#
+# Copyright (c) 2025
+# Author: Mohamed Samir Abouelez 
+# Website: https://odoo-vip.com
+# Email: kenzey0man@gmail.com
+# Phone: +20 100 057 3614
+#
+# License: Odoo Proprietary License v1.0 (OPL-1)
+# License URL: https://www.odoo.com/documentation/master/legal/licenses.html#odoo-proprietary-license
+#
+# ---------------------------------------------------------------------------
+# ⚠️ Usage and Modification Restrictions:
+#
+# - This software is licensed under the Odoo Proprietary License (OPL-1).
+# - You are NOT permitted to modify, copy, redistribute, or reuse any part of
+#   this source code without the explicit written consent of the author.
+# - Partial use, extraction, reverse engineering, or integration of this code
+#   into other projects without authorization is strictly prohibited.
+# - Any commercial use or deployment must be approved directly by:
+#     Mohamed Samir Abouelez 
+#     Email: kenzey0man@gmail.com
+#
+# ---------------------------------------------------------------------------
+# © 2025 — All Rights Reserved — Mohamed Samir Abouelez 
+#################################################################################
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+RENAMED_SERVERS_PARAM = 'voip_webrtc_freepbx.renamed_api_key_server_ids'
+
+
+def migrate(cr, version):
+    """Tell the administrators which servers got a new API key
+
+    The PBX of each server renamed by the pre-migration keeps sending the
+    old key, so its webhooks are refused until it is reconfigured. The
+    api_key_fingerprint column is new in this version and computed from
+    the renamed keys when the module update creates it.
+    """
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    param = env['ir.config_parameter'].search([('key', '=', RENAMED_SERVERS_PARAM)])
+    if not param:
+        return
+    servers = env['voip.server'].browse(int(server_id) for server_id in param.value.split(',')).exists()
+    admin = env.ref('base.user_admin', raise_if_not_found=False)
+    for server in servers:
+        server.message_post(body=env._(
+            "The API key of this server was shared with another server and has been "
+            "suffixed with the server id to make it unique. Update the webhook "
+            "configuration of the PBX with the new key."
+        ))
+        if admin:
+            server.activity_schedule(
+                'mail.mail_activity_data_todo',
+                summary=env._("Update the PBX with the new API key"),
+                user_id=admin.id,
+            )
+    _logger.info("📣 Notified the administrators of %s renamed VoIP server API keys", len(servers))
+    param.unlink()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#################################################################################
+#
+# Module Name: Voip Webrtc Freepbx
+# Description: Establishes real-time VoIP communication between Odoo and FreePBX 
+#              using WebRTC and PJSIP for seamless browser-based calling integration.
+#
+# Copyright (c) 2025
+# Author: Mohamed Samir Abouelez 
+# Website: https://odoo-vip.com
+# Email: kenzey0man@gmail.com
+# Phone: +20 100 057 3614
+#
+# License: Odoo Proprietary License v1.0 (OPL-1)
+# License URL: https://www.odoo.com/documentation/master/legal/licenses.html#odoo-proprietary-license
+#
+# ---------------------------------------------------------------------------
+# ⚠️ Usage and Modification Restrictions:
+#
+# - This software is licensed under the Odoo Proprietary License (OPL-1).
+# - You are NOT permitted to modify, copy, redistribute, or reuse any part of
+#   this source code without the explicit written consent of the author.
+# - Partial use, extraction, reverse engineering, or integration of this code
+#   into other projects without authorization is strictly prohibited.
+# - Any commercial use or deployment must be approved directly by:
+#     Mohamed Samir Abouelez 
+#     Email: kenzey0man@gmail.com
+#
+# ---------------------------------------------------------------------------
+# © 2025 — All Rights Reserved — Mohamed Samir Abouelez 
+#################################################################################
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Keep only the oldest default hold music of each server
+
+    Earlier versions allowed several defaults per server, which the
+    unique_server_default constraint of voip.hold.music now refuses.
+    """
+    if not version:
+        return
+    cr.execute("""
+        UPDATE voip_hold_music
+           SET is_default = FALSE
+         WHERE is_default
+           AND id NOT IN (SELECT MIN(id) FROM voip_hold_music WHERE is_default GROUP BY server_id)
+    """)
+    if cr.rowcount:
+        _logger.info("🎵 Cleared the default flag of %s duplicate hold music", cr.rowcount)
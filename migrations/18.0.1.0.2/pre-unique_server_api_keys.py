@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#################################################################################
+#
+# Module Name: Voip Webrtc Freepbx
+# Description: Establishes real-time VoIP communication between Odoo and FreePBX 
+#              using WebRTC and PJSIP for seamless browser-based calling integration.
+#
+# Copyright (c) 2025
+# Author: Mohamed Samir Abouelez 
+# Website: https://odoo-vip.com
+# Email: kenzey0man@gmail.com
+# Phone: +20 100 057 3614
+#
+# License: Odoo Proprietary License v1.0 (OPL-1)
+# License URL: https://www.odoo.com/documentation/master/legal/licenses.html#odoo-proprietary-license
+#
+# ---------------------------------------------------------------------------
+# ⚠️ Usage and Modification Restrictions:
+#
+# - This software is licensed under the Odoo Proprietary License (OPL-1).
+# - You are NOT permitted to modify, copy, redistribute, or reuse any part of
+#   this source code without the explicit written consent of the author.
+# - Partial use, extraction, reverse engineering, or integration of this code
+#   into other projects without authorization is strictly prohibited.
+# - Any commercial use or deployment must be approved directly by:
+#     Mohamed Samir Abouelez 
+#     Email: kenzey0man@gmail.com
+#
+# ---------------------------------------------------------------------------
+# © 2025 — All Rights Reserved — Mohamed Samir Abouelez 
+#################################################################################
+import logging
+
+_logger = logging.getLogger(__name__)
+
+RENAMED_SERVERS_PARAM = 'voip_webrtc_freepbx.renamed_api_key_server_ids'
+
+
+def migrate(cr, version):
+    """Make the API keys unique before the api_key_unique constraint is added
+
+    Earlier versions only checked uniqueness in Python. The keys shared by
+    several servers are suffixed with the server id, keeping the oldest
+    server's key unchanged; the renamed servers are remembered for the
+    post-migration to notify the administrators.
+    """
+    if not version:
+        return
+    cr.execute("""
+        UPDATE voip_server SET api_key = api_key || '-' || id
+         WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY api_key ORDER BY id) AS rank
+                  FROM voip_server WHERE api_key IS NOT NULL) AS keys
+             WHERE rank > 1)
+     RETURNING id
+    """)
+    renamed_ids = [row[0] for row in cr.fetchall()]
+    if not renamed_ids:
+        return
+    _logger.warning("⚠️ Renamed duplicate API keys of VoIP servers %s", renamed_ids)
+    cr.execute("""
+        INSERT INTO ir_config_parameter (key, value, create_uid, create_date, write_uid, write_date)
+        VALUES (%s, %s, 1, NOW() AT TIME ZONE 'UTC', 1, NOW() AT TIME ZONE 'UTC')
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+    """, (RENAMED_SERVERS_PARAM, ','.join(map(str, renamed_ids))))
@@ -34,4 +34,6 @@ from . import voip_user
 from . import voip_call
 from . import voip_recording
 from . import voip_event
+from . import voip_webhook_queue
 from . import voip_hold_music
+from . import res_partner
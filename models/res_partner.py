@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#################################################################################
+#
+# Module Name: Voip Webrtc Freepbx
+# Description: Establishes real-time VoIP communication between Odoo and FreePBX 
+#              using WebRTC and PJSIP for seamless browser-based calling integration.
+#
+# Copyright (c) 2025
+# Author: Mohamed Samir Abouelez 
+# Website: https://odoo-vip.com
+# Email: kenzey0man@gmail.com
+# Phone: +20 100 057 3614
+#
+# License: Odoo Proprietary License v1.0 (OPL-1)
+# License URL: https://www.odoo.com/documentation/master/legal/licenses.html#odoo-proprietary-license
+#
+# ---------------------------------------------------------------------------
+# ⚠️ Usage and Modification Restrictions:
+#
+# - This software is licensed under the Odoo Proprietary License (OPL-1).
+# - You are NOT permitted to modify, copy, redistribute, or reuse any part of
+#   this source code without the explicit written consent of the author.
+# - Partial use, extraction, reverse engineering, or integration of this code
+#   into other projects without authorization is strictly prohibited.
+# - Any commercial use or deployment must be approved directly by:
+#     Mohamed Samir Abouelez 
+#     Email: kenzey0man@gmail.com
+#
+# ---------------------------------------------------------------------------
+# © 2025 — All Rights Reserved — Mohamed Samir Abouelez 
+#################################################################################
+from odoo import models, fields, api
+
+# Characters dropped from phone numbers before matching
+_PHONE_STRIP = str.maketrans('', '', ' -()+.')
+
+# Shorter numbers (internal extensions) would match any partner containing them
+_MIN_PHONE_DIGITS = 4
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    # Numbers without formatting characters, so calls match partners however
+    # their numbers were typed; trigram indexes serve the ilike lookups
+    # (plain btree without pg_trgm)
+    voip_phone_normalized = fields.Char(
+        compute='_compute_voip_phone_normalized', store=True, index='trigram')
+    voip_mobile_normalized = fields.Char(
+        compute='_compute_voip_phone_normalized', store=True, index='trigram')
+
+    @api.depends('phone', 'mobile')
+    def _compute_voip_phone_normalized(self):
+        for partner in self:
+            partner.voip_phone_normalized = partner.phone and partner.phone.translate(_PHONE_STRIP)
+            partner.voip_mobile_normalized = partner.mobile and partner.mobile.translate(_PHONE_STRIP)
+
+    @api.model
+    def _voip_find_by_phone(self, phone):
+        """Return the first partner matching phone
+
+        When phone_validation is installed the number is formatted to E.164
+        and matched against the indexed phone_sanitized column first; when
+        that fails, or phone_validation is missing, the cleaned number is
+        matched against the normalized phone and mobile with ilike.
+        """
+        if not phone:
+            return self.browse()
+
+        if 'phone_sanitized' in self._fields:
+            sanitized = self._phone_format(number=phone, raise_exception=False)
+            if sanitized:
+                partner = self.search([('phone_sanitized', '=', sanitized)], limit=1)
+                if partner:
+                    return partner
+
+        # Clean phone number
+        clean_phone = phone.translate(_PHONE_STRIP)
+        if len(clean_phone) < _MIN_PHONE_DIGITS:
+            return self.browse()
+        return self.search([
+            '|',
+            ('voip_phone_normalized', 'ilike', clean_phone),
+            ('voip_mobile_normalized', 'ilike', clean_phone),
+        ], limit=1)
+
+    @api.model
+    def _voip_find_by_phones(self, phones):
+        """Return a {phone: partner} map for phones, resolved with one search per strategy
+
+        Batched lookup used when calls are created: unlike
+        _voip_find_by_phone(), only exact matches on the sanitized or
+        normalized numbers link a partner, so the searches stay on the
+        indexes and never pull partners that merely contain a number.
+        Numbers without a matching partner are left out.
+        """
+        phones = {phone for phone in phones if phone}
+        result = {}
+
+        if 'phone_sanitized' in self._fields:
+            sanitized = {phone: self._phone_format(number=phone, raise_exception=False) for phone in phones}
+            by_sanitized = {}
+            if any(sanitized.values()):
+                for partner in self.search([('phone_sanitized', 'in', [s for s in sanitized.values() if s])]):
+                    by_sanitized.setdefault(partner.phone_sanitized, partner)
+            result.update(
+                (phone, by_sanitized[s]) for phone, s in sanitized.items() if s in by_sanitized
+            )
+            # Numbers that cannot be formatted or matched fall back to the normalized ones
+            phones = {phone for phone in phones if phone not in result}
+
+        cleaned = {phone: phone.translate(_PHONE_STRIP) for phone in phones}
+        cleaned = {phone: clean for phone, clean in cleaned.items() if len(clean) >= _MIN_PHONE_DIGITS}
+        if not cleaned:
+            return result
+
+        numbers = list(set(cleaned.values()))
+        by_number = {}
+        for partner in self.search([
+            '|',
+            ('voip_phone_normalized', 'in', numbers),
+            ('voip_mobile_normalized', 'in', numbers),
+        ]):
+            for number in (partner.voip_phone_normalized, partner.voip_mobile_normalized):
+                if number:
+                    by_number.setdefault(number, partner)
+        result.update(
+            (phone, by_number[clean]) for phone, clean in cleaned.items() if clean in by_number
+        )
+        return result
@@ -29,7 +29,7 @@
 # ---------------------------------------------------------------------------
 # © 2025 — All Rights Reserved — Mohamed Samir Abouelez 
 #################################################################################
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError
 import logging
 
@@ -63,7 +63,8 @@ class VoipCall(models.Model):
         string='VoIP Server',
         related='user_id.server_id',
         store=True,
-        readonly=True
+        readonly=True,
+        index=True
     )
     
     odoo_user_id = fields.Many2one(
@@ -111,6 +112,7 @@ class VoipCall(models.Model):
     start_time = fields.Datetime(
         string='Start Time',
         required=True,
+        index=True,
         default=fields.Datetime.now,
         tracking=True
     )
@@ -146,6 +148,7 @@ class VoipCall(models.Model):
     
     call_id = fields.Char(
         string='SIP Call ID',
+        index='btree_not_null',
         help='Unique SIP call identifier'
     )
     
@@ -163,8 +166,7 @@ class VoipCall(models.Model):
     
     has_recording = fields.Boolean(
         string='Has Recording',
-        compute='_compute_recording_count',
-        store=True,
+        compute='_compute_has_recording',
         search='_search_has_recording'
     )
     
@@ -177,46 +179,62 @@ class VoipCall(models.Model):
         help='Reason for call termination'
     )
 
+    def init(self):
+        # Calls of a user by date, for the VoIP user statistics; also serves
+        # plain user_id lookups
+        tools.create_index(self.env.cr, 'voip_call_user_id_start_time_index',
+                           self._table, ['user_id', 'start_time DESC'])
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        new_name = _('New')
+        unnamed = [vals for vals in vals_list if vals.get('name', new_name) == new_name]
+        if unnamed:
+            IrSequence = self.env['ir.sequence']
+            for vals in unnamed:
+                vals['name'] = IrSequence.next_by_code('voip.call') or new_name
+        # Link contacts of the whole batch at once, like _onchange_find_partner
+        unlinked = [vals for vals in vals_list if not vals.get('partner_id')]
+        if unlinked:
+            partners = self.env['res.partner']._voip_find_by_phones(
+                self._get_contact_number(vals) for vals in unlinked
+            )
+            for vals in unlinked:
+                partner = partners.get(self._get_contact_number(vals))
+                if partner:
+                    vals['partner_id'] = partner.id
+        return super(VoipCall, self).create(vals_list)
+
     @api.model
-    def create(self, vals):
-        if vals.get('name', _('New')) == _('New'):
-            vals['name'] = self.env['ir.sequence'].next_by_code('voip.call') or _('New')
-        return super(VoipCall, self).create(vals)
+    def _get_contact_number(self, vals):
+        """Return the number of the other party of a call from its values"""
+        if vals.get('direction') == 'inbound':
+            return vals.get('from_number')
+        return vals.get('to_number')
 
     @api.depends('start_time', 'answer_time')
     def _compute_response_time(self):
         """Calculate response time in seconds between start_time and answer_time"""
-        for record in self:
-            if record.start_time and record.answer_time:
-                delta = record.answer_time - record.start_time
-                record.response_time = int(delta.total_seconds())
-            else:
-                record.response_time = 0
+        answered = self.filtered(lambda call: call.start_time and call.answer_time)
+        (self - answered).response_time = 0
+        for record in answered:
+            record.response_time = int((record.answer_time - record.start_time).total_seconds())
 
     @api.depends('answer_time', 'end_time', 'start_time')
     def _compute_duration(self):
-        for record in self:
-            if record.end_time:
-                # If answer_time exists, calculate from answer_time to end_time
-                if record.answer_time:
-                    delta = record.end_time - record.answer_time
-                    record.duration = delta.total_seconds()
-                # If no answer_time but end_time exists, calculate from start_time to end_time
-                elif record.start_time:
-                    delta = record.end_time - record.start_time
-                    record.duration = delta.total_seconds()
-                else:
-                    record.duration = 0.0
-            else:
-                record.duration = 0.0
+        ended = self.filtered(lambda call: call.end_time and (call.answer_time or call.start_time))
+        (self - ended).duration = 0.0
+        for record in ended:
+            # From answer_time when the call was answered, else from start_time
+            begin = record.answer_time or record.start_time
+            record.duration = (record.end_time - begin).total_seconds()
 
     @api.depends('duration')
     def _compute_duration_display(self):
         for record in self:
             if record.duration:
-                hours = int(record.duration // 3600)
-                minutes = int((record.duration % 3600) // 60)
-                seconds = int(record.duration % 60)
+                minutes, seconds = divmod(int(record.duration), 60)
+                hours, minutes = divmod(minutes, 60)
                 
                 if hours > 0:
                     record.duration_display = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
@@ -227,27 +245,37 @@ class VoipCall(models.Model):
 
     @api.depends('recording_ids')
     def _compute_recording_count(self):
+        # One grouped count for the batch instead of reading each call's recordings
+        counts = {}
+        if self.ids:
+            counts = {
+                call.id: count
+                for call, count in self.env['voip.recording']._read_group(
+                    [('call_id', 'in', self.ids)], ['call_id'], ['__count'],
+                )
+            }
+        for record in self:
+            record.recording_count = counts.get(record.id, 0) if record.id else len(record.recording_ids)
+        _logger.debug('🔧 VoIP Call Debug: Recomputed recording count of %s calls', len(self))
+    
+    @api.depends('recording_count')
+    def _compute_has_recording(self):
         for record in self:
-            record.recording_count = len(record.recording_ids)
             record.has_recording = record.recording_count > 0
-            _logger.info('🔧 VoIP Call Debug: Call %s has %s recordings', record.name, record.recording_count)
     
     def _search_has_recording(self, operator, value):
-        """Search method for has_recording field"""
-        if operator == '=' and value:
-            # Find calls that have recordings
-            return [('recording_count', '>', 0)]
-        elif operator == '=' and not value:
-            # Find calls without recordings
-            return [('recording_count', '=', 0)]
-        elif operator == '!=' and value:
-            # Find calls without recordings
-            return [('recording_count', '=', 0)]
-        elif operator == '!=' and not value:
-            # Find calls that have recordings
-            return [('recording_count', '>', 0)]
-        else:
+        """Search method for has_recording field
+
+        The ORM turns these into a semi/anti-join on voip_recording,
+        independent of the recording_count.
+        """
+        if operator not in ('=', '!='):
             return []
+        if bool(value) == (operator == '='):
+            # Find calls that have recordings
+            return [('recording_ids', '!=', False)]
+        # Find calls without recordings
+        return [('recording_ids', '=', False)]
 
     @api.onchange('from_number', 'to_number', 'direction')
     def _onchange_find_partner(self):
@@ -257,16 +285,8 @@ class VoipCall(models.Model):
             phone = self.to_number
         
         if phone:
-            # Clean phone number for search
-            clean_phone = phone.replace(' ', '').replace('-', '').replace('(', '').replace(')', '')
-            
             # Search for partner by phone
-            partner = self.env['res.partner'].search([
-                '|', '|',
-                ('phone', 'ilike', clean_phone),
-                ('mobile', 'ilike', clean_phone),
-                ('phone', 'ilike', phone)
-            ], limit=1)
+            partner = self.env['res.partner']._voip_find_by_phone(phone)
             
             if partner:
                 self.partner_id = partner
@@ -291,18 +311,17 @@ class VoipCall(models.Model):
             })
 
     def action_end_call(self, reason='normal'):
-        self.ensure_one()
+        """End the calls, with one write per resulting state and a shared end time"""
         vals = {
             'end_time': fields.Datetime.now(),
             'hangup_reason': reason
         }
         
-        if self.state == 'ringing':
-            vals['state'] = 'missed'
-        elif self.state == 'in_progress':
-            vals['state'] = 'completed'
-        
-        self.write(vals)
+        ringing = self.filtered(lambda call: call.state == 'ringing')
+        in_progress = self.filtered(lambda call: call.state == 'in_progress')
+        ringing.write(dict(vals, state='missed'))
+        in_progress.write(dict(vals, state='completed'))
+        (self - ringing - in_progress).write(vals)
 
     def action_mark_as_missed(self):
         self.ensure_one()
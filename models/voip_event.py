@@ -1,8 +1,106 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
+from odoo.tools import SQL
 from datetime import datetime
-import json
+import functools
+import logging
+import re
+from ..utils.json_utils import json_dumps, json_loads
+
+_logger = logging.getLogger(__name__)
+
+@functools.lru_cache(maxsize=1024)
+def _parse_timestamp(timestamp_str):
+    """Parse a webhook timestamp, None if it is not in a known format
+
+    Cached: bursts of AMI events usually share the same second.
+    """
+    try:
+        # Handle different timestamp formats
+        if 'T' in timestamp_str:
+            if timestamp_str.endswith('Z'):
+                timestamp_str = timestamp_str[:-1] + '+00:00'
+            return datetime.fromisoformat(timestamp_str)
+        return datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+# voip.event field -> key in the AMI event data
+_EVENT_DATA_FIELDS = {
+    'channel': 'Channel',
+    'caller_id_num': 'CallerIDNum',
+    'caller_id_name': 'CallerIDName',
+    'connected_line_num': 'ConnectedLineNum',
+    'connected_line_name': 'ConnectedLineName',
+    'extension': 'Exten',
+    'context': 'Context',
+    'unique_id': 'Uniqueid',
+    'linked_id': 'Linkedid',
+}
+
+# voip.event field -> key in the webhook server_info
+_SERVER_INFO_FIELDS = {
+    'server_hostname': 'hostname',
+    'server_ami_host': 'ami_host',
+    'server_ami_username': 'ami_username',
+}
+
+# voip.event field -> key in the webhook statistics, defaulting to 0
+_STATISTICS_FIELDS = {
+    'total_events': 'total_events',
+    'sent_events': 'sent_events',
+    'failed_events': 'failed_events',
+    'skipped_events': 'skipped_events',
+}
+
+# Event types flagged as call events
+_CALL_EVENTS = frozenset({'Newchannel', 'Hangup', 'Dial', 'DialBegin', 'DialEnd', 'Bridge', 'Unbridge'})
+
+# Event type -> summary template, other types get "<type> event"
+_EVENT_SUMMARY_FORMATS = {
+    'Newchannel': "New call from {caller} to {extension}",
+    'Hangup': "Call ended: {channel}",
+    'PeerStatus': "Peer status change: {peer}",
+}
+
+
+# Extension part of an AMI peer or channel ("PJSIP/200", "PJSIP/200-00000001" -> "200")
+_PEER_RE = re.compile(r'^\w+/([^-\s]+)')
+
+# AMI PeerStatus -> voip.user status
+_PEER_STATUS_MAP = {
+    'Reachable': 'available',
+    'Unreachable': 'offline',
+    'Lagged': 'away',
+    'Busy': 'busy',
+}
+
+# AMI ChannelState -> voip.user status
+_CHANNEL_STATE_MAP = {
+    '0': 'available',  # Down (Hangup)
+    '1': 'busy',  # Reserved
+    '2': 'busy',  # OffHook
+    '3': 'busy',  # Dialing
+    '4': 'busy',  # Ring
+    '5': 'busy',  # Busy
+    '6': 'busy',  # Up (Connected)
+}
+
+# AMI event type -> voip.event handler method, called with (event_data, server_id)
+# TODO: Hangup (call duration, status), Dial (outgoing calls), Bridge (call connections)
+_WEBHOOK_HANDLERS = {
+    'PeerStatus': '_handle_peer_status_event',
+    'Newstate': '_handle_newstate_event',
+    'Newchannel': '_handle_newchannel_event',
+}
+
+
+def _extract_extension(peer_or_channel):
+    """Return the extension of an AMI peer or channel name"""
+    match = _PEER_RE.match(peer_or_channel)
+    return match.group(1) if match else peer_or_channel.strip()
 
 
 class VoipEvent(models.Model):
@@ -31,17 +129,30 @@ class VoipEvent(models.Model):
         help='The server that generated this event'
     )
     
-    # Event Data
+    # Event Data: large payloads, only fetched when explicitly read
     raw_data = fields.Text(
         string='Raw Event Data',
+        prefetch=False,
         help='Complete raw JSON data from the webhook'
     )
     
     event_data = fields.Text(
         string='Parsed Event Data',
+        prefetch=False,
         help='Parsed and formatted event data'
     )
     
+    # Indented copies for the form view; the stored JSON is compact
+    raw_data_pretty = fields.Text(
+        string='Raw Event Data (Formatted)',
+        compute='_compute_pretty_data'
+    )
+    
+    event_data_pretty = fields.Text(
+        string='Parsed Event Data (Formatted)',
+        compute='_compute_pretty_data'
+    )
+    
     # Call Information (if applicable)
     channel = fields.Char(
         string='Channel',
@@ -85,6 +196,7 @@ class VoipEvent(models.Model):
     
     linked_id = fields.Char(
         string='Linked ID',
+        index='btree_not_null',
         help='Linked call identifier'
     )
     
@@ -151,79 +263,95 @@ class VoipEvent(models.Model):
         help='Notes about event processing'
     )
     
+    def init(self):
+        # Related events of a call, newest first; most events carry no Uniqueid
+        tools.create_index(self.env.cr, 'voip_event_unique_id_timestamp_index',
+                           self._table, ['unique_id', 'timestamp DESC'],
+                           where='unique_id IS NOT NULL')
+        # Event list filtered by type, in the default newest-first order
+        tools.create_index(self.env.cr, 'voip_event_event_type_timestamp_index',
+                           self._table, ['event_type', 'timestamp DESC'])
+
     @api.depends('event_type', 'caller_id_num', 'caller_id_name', 'extension', 'channel')
     def _compute_event_summary(self):
         for record in self:
-            if record.event_type == 'Newchannel':
-                record.event_summary = f"New call from {record.caller_id_num or 'Unknown'} to {record.extension or 'Unknown'}"
-            elif record.event_type == 'Hangup':
-                record.event_summary = f"Call ended: {record.channel or 'Unknown channel'}"
-            elif record.event_type == 'PeerStatus':
-                record.event_summary = f"Peer status change: {record.channel or 'Unknown peer'}"
+            summary_format = _EVENT_SUMMARY_FORMATS.get(record.event_type)
+            if summary_format:
+                record.event_summary = summary_format.format(
+                    caller=record.caller_id_num or 'Unknown',
+                    extension=record.extension or 'Unknown',
+                    channel=record.channel or 'Unknown channel',
+                    peer=record.channel or 'Unknown peer',
+                )
             else:
                 record.event_summary = f"{record.event_type} event"
     
     @api.depends('event_type')
     def _compute_is_call_event(self):
-        call_events = ['Newchannel', 'Hangup', 'Dial', 'DialBegin', 'DialEnd', 'Bridge', 'Unbridge']
         for record in self:
-            record.is_call_event = record.event_type in call_events
+            record.is_call_event = record.event_type in _CALL_EVENTS
+    
+    @api.depends('raw_data', 'event_data')
+    def _compute_pretty_data(self):
+        def pretty(data):
+            try:
+                return json_dumps(json_loads(data), indent=True) if data else data
+            except ValueError:
+                return data
+        for record in self:
+            record.raw_data_pretty = pretty(record.raw_data)
+            record.event_data_pretty = pretty(record.event_data)
+    
+    @api.model
+    def _prepare_webhook_vals(self, event_data, server_id):
+        """Build voip.event values from a whole webhook payload
+
+        event_data is the object posted by the PBX (event_type, timestamp,
+        data, server_info, statistics), not only its 'data' part.
+        """
+        # Extract basic information
+        event_type = event_data.get('event_type', 'Unknown')
+        timestamp_str = event_data.get('timestamp', '')
+        
+        # Parse timestamp
+        timestamp = _parse_timestamp(timestamp_str) if timestamp_str else None
+        if timestamp is None:
+            timestamp = datetime.now()
+        
+        # Extract event data
+        data = event_data.get('data', {})
+        server_info = event_data.get('server_info', {})
+        statistics = event_data.get('statistics', {})
+        
+        vals = {
+            'event_type': event_type,
+            'timestamp': timestamp,
+            'server_id': server_id,
+            'raw_data': json_dumps(event_data),
+            'event_data': json_dumps(data),
+        }
+        data_get = data.get
+        vals.update({field: data_get(key) for field, key in _EVENT_DATA_FIELDS.items()})
+        server_info_get = server_info.get
+        vals.update({field: server_info_get(key) for field, key in _SERVER_INFO_FIELDS.items()})
+        statistics_get = statistics.get
+        vals.update({field: statistics_get(key, 0) for field, key in _STATISTICS_FIELDS.items()})
+        return vals
     
     @api.model
     def create_from_webhook(self, event_data, server_id):
         """
-        Create a new event record from webhook data
+        Create event records from webhook data
+
+        event_data is one event dict or a list of them; all events are
+        created with a single batched create().
         """
+        if isinstance(event_data, dict):
+            event_data = [event_data]
         try:
-            # Extract basic information
-            event_type = event_data.get('event_type', 'Unknown')
-            timestamp_str = event_data.get('timestamp', '')
-            
-            # Parse timestamp
-            timestamp = None
-            if timestamp_str:
-                try:
-                    # Handle different timestamp formats
-                    if 'T' in timestamp_str:
-                        timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                    else:
-                        timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-                except ValueError:
-                    timestamp = datetime.now()
-            else:
-                timestamp = datetime.now()
-            
-            # Extract event data
-            data = event_data.get('data', {})
-            server_info = event_data.get('server_info', {})
-            statistics = event_data.get('statistics', {})
-            
-            # Create event record
-            event_record = self.create({
-                'event_type': event_type,
-                'timestamp': timestamp,
-                'server_id': server_id,
-                'raw_data': json.dumps(event_data, indent=2),
-                'event_data': json.dumps(data, indent=2),
-                'channel': data.get('Channel'),
-                'caller_id_num': data.get('CallerIDNum'),
-                'caller_id_name': data.get('CallerIDName'),
-                'connected_line_num': data.get('ConnectedLineNum'),
-                'connected_line_name': data.get('ConnectedLineName'),
-                'extension': data.get('Exten'),
-                'context': data.get('Context'),
-                'unique_id': data.get('Uniqueid'),
-                'linked_id': data.get('Linkedid'),
-                'server_hostname': server_info.get('hostname'),
-                'server_ami_host': server_info.get('ami_host'),
-                'server_ami_username': server_info.get('ami_username'),
-                'total_events': statistics.get('total_events', 0),
-                'sent_events': statistics.get('sent_events', 0),
-                'failed_events': statistics.get('failed_events', 0),
-                'skipped_events': statistics.get('skipped_events', 0),
-            })
-            
-            return event_record
+            return self.create([
+                self._prepare_webhook_vals(data, server_id) for data in event_data
+            ])
             
         except Exception as e:
             # Log error but don't fail the webhook
@@ -232,9 +360,279 @@ class VoipEvent(models.Model):
             _logger.error(f"Failed to create event record: {str(e)}")
             return None
     
+    @api.model
+    def _create_from_webhook_fast(self, event_data, server_id):
+        """
+        Insert an event row from webhook data with a single INSERT
+
+        See _create_from_webhook_batch(). Returns the new event id.
+        """
+        return self._create_from_webhook_batch([(event_data, server_id)])[0]
+    
+    @api.model
+    def _create_from_webhook_batch(self, events):
+        """
+        Insert event rows for a list of (event_data, server_id) with one INSERT
+
+        Event rows are write-once logs, so the ORM create pipeline is
+        skipped; stored computed fields are evaluated on an in-memory
+        record and written along with the other columns.
+        Returns the new event ids, in order.
+        """
+        rows = []
+        for event_data, server_id in events:
+            vals = self._prepare_webhook_vals(event_data, server_id)
+            draft = self.new(vals)
+            vals.update({
+                'event_summary': draft.event_summary,
+                'is_call_event': draft.is_call_event,
+                'processed': 'draft',
+            })
+            rows.append(vals)
+        if not rows:
+            return []
+
+        uid = self.env.uid
+        columns = list(rows[0])
+        self.env.cr.execute(SQL(
+            """INSERT INTO voip_event (%s, create_uid, write_uid, create_date, write_date)
+               VALUES %s
+               RETURNING id""",
+            SQL(', ').join(map(SQL.identifier, columns)),
+            SQL(', ').join(
+                SQL(
+                    "(%s, %s, %s, NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC')",
+                    SQL(', ').join(row[column] for column in columns),
+                    uid, uid,
+                )
+                for row in rows
+            ),
+        ))
+        return [event_id for event_id, in self.env.cr.fetchall()]
+    
+    @api.model
+    def _process_webhook_events(self, events):
+        """Store and handle a list of (payload, server_id) webhook events
+
+        payload is the whole webhook object (event_type, timestamp, data...).
+        The events kept by their server's event log settings are stored with
+        one INSERT, then each event is handled in its own savepoint so one
+        failing event does not roll back the others. Must be called as
+        superuser. Returns the number of events that failed.
+        """
+        Server = self.env['voip.server']
+        to_store = [
+            (payload, server_id) for payload, server_id in events
+            if Server._should_store_event(server_id, payload.get('event_type', 'Unknown'))
+        ]
+        try:
+            # Raw INSERT: no need to flush pending ORM writes of the batch
+            with self.env.cr.savepoint(flush=False):
+                self._create_from_webhook_batch(to_store)
+        except Exception as e:
+            _logger.warning("⚠️ Failed to save %s events to database: %s", len(to_store), e)
+
+        failed = 0
+        for payload, server_id in events:
+            try:
+                with self.env.cr.savepoint(flush=False):
+                    self._handle_webhook_event(payload, server_id)
+            except Exception:
+                failed += 1
+                _logger.exception("❌ Error processing webhook event")
+        return failed
+
+    @api.model
+    def _handle_webhook_event(self, payload, server_id):
+        """Run the handler of a webhook event, see _WEBHOOK_HANDLERS"""
+        event_type = payload.get('event_type', 'Unknown')
+        event_data = payload.get('data', {})
+
+        # Extract common call information
+        caller_id = event_data.get('CallerIDNum')
+
+        _logger.debug(
+            "📞 Call Details: channel=%s caller=%s (%s) exten=%s context=%s uniqueid=%s",
+            event_data.get('Channel'), caller_id, event_data.get('CallerIDName'),
+            event_data.get('Exten'), event_data.get('Context'), event_data.get('Uniqueid'),
+        )
+
+        # ===== YOUR BUSINESS LOGIC HERE =====
+        # Process different event types
+        handler = _WEBHOOK_HANDLERS.get(event_type)
+        if handler:
+            _logger.debug("📞 Processing %s event...", event_type)
+            getattr(self, handler)(event_data, server_id)
+        else:
+            _logger.debug("📞 Event %s received (no specific handler)", event_type)
+
+        # ===== EXAMPLE: Search for contact by phone =====
+        if caller_id:
+            partners = self.env['res.partner']._voip_find_by_phone(caller_id)
+
+            if partners:
+                _logger.debug("👤 Found contact: %s (ID: %s)", partners.name, partners.id)
+                # TODO: Update contact activity, create call log, etc.
+            else:
+                _logger.debug("👤 No contact found for: %s", caller_id)
+                # TODO: Create notification for new contact, etc.
+
+    @api.model
+    def _handle_peer_status_event(self, event_data, server_id):
+        """Handle PeerStatus events to update user status
+        Note: Uses sudo() for webhook access to voip.user records
+        """
+        try:
+            _logger.debug("🔔 Processing PeerStatus event...")
+            
+            # Extract peer information
+            peer = event_data.get('Peer', '')
+            peer_status = event_data.get('PeerStatus', '')
+            channel_type = event_data.get('ChannelType', '')
+            
+            _logger.debug("🔔 Peer: %s, Status: %s, Type: %s", peer, peer_status, channel_type)
+            
+            if not peer or not peer_status:
+                _logger.warning("🔔 Missing peer or status information")
+                return
+            
+            # Extract extension from peer (e.g., "PJSIP/200" -> "200")
+            extension = _extract_extension(peer)
+            
+            if not extension:
+                _logger.warning("🔔 Could not extract extension from peer: %s", peer)
+                return
+            
+            _logger.debug("🔔 Extracted extension: %s", extension)
+            
+            # Find user of this server by extension or SIP username
+            voip_user = self.env['voip.user'].sudo()._get_user_by_extension(extension, server_id, strict=True)
+            
+            if not voip_user:
+                _logger.warning("🔔 User not found for extension: %s", extension)
+                return
+            
+            # Map PeerStatus to user status
+            new_status = _PEER_STATUS_MAP.get(peer_status)
+            if not new_status:
+                _logger.debug("🔔 Unknown peer status: %s, keeping current status", peer_status)
+                return
+            
+            # Update user status if changed
+            changed, old_status = voip_user._set_status(new_status)
+            if changed:
+                _logger.info("🔔 User status change: %s (%s) - %s → %s (Peer: %s)", voip_user.name, voip_user.sip_username, old_status, new_status, peer)
+            else:
+                _logger.debug("🔔 User %s status unchanged: %s", voip_user.name, new_status)
+            
+        except Exception as e:
+            _logger.exception("Error handling PeerStatus event: %s", str(e))
+
+    @api.model
+    def _handle_newstate_event(self, event_data, server_id):
+        """Handle Newstate events to update user status during calls
+        Note: Uses sudo() for webhook access to voip.user records
+        """
+        try:
+            _logger.debug("🔔 Processing Newstate event...")
+            
+            # Extract call information
+            channel = event_data.get('Channel', '')
+            channel_state = event_data.get('ChannelState', '')
+            channel_state_desc = event_data.get('ChannelStateDesc', '')
+            caller_id = event_data.get('CallerIDNum', '')
+            context = event_data.get('Context', '')
+            
+            _logger.debug("🔔 Channel: %s, State: %s (%s)", channel, channel_state, channel_state_desc)
+            
+            if not channel or not channel_state:
+                _logger.warning("🔔 Missing channel or state information")
+                return
+            
+            # Extract extension from channel (e.g., "PJSIP/200-00000001" -> "200")
+            extension = _extract_extension(channel)
+            
+            if not extension:
+                _logger.warning("🔔 Could not extract extension from channel: %s", channel)
+                return
+            
+            _logger.debug("🔔 Extracted extension: %s", extension)
+            
+            # Find user of this server by extension or SIP username
+            voip_user = self.env['voip.user'].sudo()._get_user_by_extension(extension, server_id, strict=True)
+            
+            if not voip_user:
+                _logger.warning("🔔 User not found for extension: %s", extension)
+                return
+            
+            # Map ChannelState to user status
+            new_status = _CHANNEL_STATE_MAP.get(channel_state)
+            if not new_status:
+                _logger.debug("🔔 Unknown channel state: %s, keeping current status", channel_state)
+                return
+            
+            # Update user status if changed
+            changed, old_status = voip_user._set_status(new_status)
+            if changed:
+                _logger.info("🔔 User status change: %s (%s) - %s → %s (Channel: %s, State: %s)", voip_user.name, voip_user.sip_username, old_status, new_status, channel, channel_state)
+            else:
+                _logger.debug("🔔 User %s status unchanged: %s", voip_user.name, new_status)
+            
+        except Exception as e:
+            _logger.exception("Error handling Newstate event: %s", str(e))
+
+    @api.model
+    def _handle_newchannel_event(self, event_data, server_id):
+        """Handle Newchannel events to update user status when calls start
+        Note: Uses sudo() for webhook access to voip.user records
+        """
+        try:
+            _logger.debug("🔔 Processing Newchannel event...")
+            
+            # Extract channel information
+            channel = event_data.get('Channel', '')
+            channel_state = event_data.get('ChannelState', '')
+            caller_id = event_data.get('CallerIDNum', '')
+            context = event_data.get('Context', '')
+            unique_id = event_data.get('Uniqueid', '')
+            
+            _logger.debug("🔔 Channel: %s, State: %s, Caller: %s", channel, channel_state, caller_id)
+            
+            if not channel:
+                _logger.warning("🔔 Missing channel information")
+                return
+            
+            # Extract extension from channel (e.g., "PJSIP/200-00000001" -> "200")
+            extension = _extract_extension(channel)
+            
+            if not extension:
+                _logger.warning("🔔 Could not extract extension from channel: %s", channel)
+                return
+            
+            _logger.debug("🔔 Extracted extension: %s", extension)
+            
+            # Find user of this server by extension or SIP username
+            voip_user = self.env['voip.user'].sudo()._get_user_by_extension(extension, server_id, strict=True)
+            
+            if not voip_user:
+                _logger.warning("🔔 User not found for extension: %s", extension)
+                return
+            
+            # Update user status to busy when new channel is created
+            new_status = 'busy'  # New channel means user is busy
+            
+            changed, old_status = voip_user._set_status(new_status)
+            if changed:
+                _logger.info("🔔 User status change: %s (%s) - %s → %s (Channel: %s)", voip_user.name, voip_user.sip_username, old_status, new_status, channel)
+            else:
+                _logger.debug("🔔 User %s status unchanged: %s", voip_user.name, new_status)
+            
+        except Exception as e:
+            _logger.exception("Error handling Newchannel event: %s", str(e))
+
     def action_mark_processed(self):
-        """Mark event as processed"""
-        self.write({'processed': True})
+        """Mark events as processed"""
+        self.write({'processed': 'done'})
     
     def action_view_related_events(self):
         """View related events (same call)"""
@@ -29,12 +29,73 @@
 # ---------------------------------------------------------------------------
 # © 2025 — All Rights Reserved — Mohamed Samir Abouelez 
 #################################################################################
-from odoo import models, fields, api, _
-from odoo.exceptions import ValidationError
+from odoo import models, fields, api, tools, _
+from odoo.exceptions import UserError, ValidationError
+from odoo.tools import SQL
+import base64
+import binascii
+import hashlib
+import io
 import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import wave
+
+# Optional: reads the duration of non-WAV hold music; WAV needs only the stdlib
+try:
+    import mutagen
+except ImportError:
+    mutagen = None
 
 _logger = logging.getLogger(__name__)
 
+# Fields deciding which music get_available_music()/get_default_music() list
+_MUSIC_LOOKUP_FIELDS = {'active', 'server_id', 'sequence', 'name', 'is_default', 'music_file'}
+
+# Fields exposed to the softphone by get_music_config()
+_MUSIC_CONFIG_FIELDS = [
+    'name', 'description', 'volume', 'loop', 'fade_in', 'fade_out',
+    'duration', 'format', 'quality', 'tags', 'is_default',
+]
+
+_EXT_TO_FORMAT = {'.mp3': 'mp3', '.wav': 'wav', '.ogg': 'ogg', '.m4a': 'm4a'}
+
+
+def _format_from_filename(filename):
+    """Return the format matching the extension of filename, WAV by default"""
+    return _EXT_TO_FORMAT.get(os.path.splitext(filename)[1].lower(), 'wav')
+
+
+# Base64 characters holding about the first 4 KiB of a file, enough for WAV headers
+_WAV_HEADER_B64_SIZE = 4096 // 3 * 4
+
+
+def _audio_duration(data):
+    """Return the duration in seconds of base64 audio data, or None
+
+    WAV durations come from the header alone, parsed by the standard library;
+    other formats need mutagen, which reads their container metadata.
+    """
+    try:
+        head = base64.b64decode(data[:_WAV_HEADER_B64_SIZE])
+    except (binascii.Error, ValueError):
+        return None
+    if head.startswith(b'RIFF') and head[8:12] == b'WAVE':
+        try:
+            with wave.open(io.BytesIO(head)) as wav:
+                return wav.getnframes() / wav.getframerate()
+        except (wave.Error, EOFError, ZeroDivisionError):
+            return None
+    if mutagen is None:
+        return None
+    try:
+        audio = mutagen.File(io.BytesIO(base64.b64decode(data)))
+    except (binascii.Error, ValueError, mutagen.MutagenError):
+        return None
+    return audio.info.length if audio else None
+
 
 class VoipHoldMusic(models.Model):
     _name = 'voip.hold.music'
@@ -55,9 +116,23 @@ class VoipHoldMusic(models.Model):
     music_file = fields.Binary(
         string='Music File',
         required=False,
+        attachment=True,
         help='Audio file for hold music (MP3, WAV, OGG)'
     )
     
+    music_file_original = fields.Binary(
+        string='Original File',
+        attachment=True,
+        help='Uploaded file kept when the music is compressed, used to re-encode it'
+    )
+    
+    compression_pending = fields.Boolean(
+        string='Compression Pending',
+        readonly=True,
+        copy=False,
+        help='Set by the Compress button until the background job re-encodes the file'
+    )
+    
     music_filename = fields.Char(
         string='Filename',
         help='Original filename of the uploaded music file'
@@ -70,6 +145,21 @@ class VoipHoldMusic(models.Model):
         help='Size of the music file in bytes'
     )
     
+    checksum = fields.Char(
+        string='Checksum',
+        compute='_compute_checksum',
+        store=True,
+        help='SHA-1 of the stored music file, used as HTTP ETag'
+    )
+    
+    music_file_valid = fields.Boolean(
+        string='Valid Audio File',
+        compute='_compute_music_file_valid',
+        store=True,
+        index=True,
+        help='Whether the stored music file starts with a RIFF/WAVE or Ogg header'
+    )
+    
     duration = fields.Float(
         string='Duration (seconds)',
         help='Duration of the music file in seconds'
@@ -154,14 +244,70 @@ class VoipHoldMusic(models.Model):
         help='Whether this is the default hold music'
     )
 
+    # At most one default music per server; duplicates left by earlier
+    # versions are cleared by the 18.0.1.0.2 pre-migration. The constraint's
+    # btree index also serves the default music lookup.
+    _sql_constraints = [
+        ('unique_server_default', 'EXCLUDE (server_id WITH =) WHERE (is_default)',
+         'Only one hold music can be the default of a VoIP server!'),
+    ]
+
+    def init(self):
+        # Active music of a server in display order
+        tools.create_index(self.env.cr, 'voip_hold_music_server_id_sequence_name_index',
+                           self._table, ['server_id', 'sequence', 'name'],
+                           where='active')
+
     @api.depends('music_file')
     def _compute_file_size(self):
+        # Saved files: use the size recorded on their attachment rather than
+        # loading and decoding them
+        sizes = {}
+        if self.ids:
+            sizes = {
+                attachment['res_id']: attachment['file_size']
+                for attachment in self.env['ir.attachment'].sudo().search_read([
+                    ('res_model', '=', self._name),
+                    ('res_field', '=', 'music_file'),
+                    ('res_id', 'in', self.ids),
+                ], ['res_id', 'file_size'])
+            }
         for record in self:
-            if record.music_file:
-                record.file_size = len(record.music_file)
+            if record.id:
+                record.file_size = sizes.get(record.id, 0)
+            elif record.music_file:
+                record.file_size = len(base64.b64decode(record.music_file))
             else:
                 record.file_size = 0
 
+    @api.depends('music_file')
+    def _compute_checksum(self):
+        for record in self:
+            data = record.music_file
+            if data:
+                if isinstance(data, str):
+                    data = data.encode()
+                record.checksum = hashlib.sha1(data).hexdigest()
+            else:
+                record.checksum = False
+
+    @api.depends('music_file')
+    def _compute_music_file_valid(self):
+        for record in self:
+            data = record.music_file
+            if not data:
+                record.music_file_valid = False
+                continue
+            try:
+                # 24 base64 characters hold the first 18 bytes of the file
+                head = base64.b64decode(data[:24])
+            except (ValueError, binascii.Error):
+                head = b''
+            record.music_file_valid = (
+                (head.startswith(b'RIFF') and head[8:12] == b'WAVE')
+                or head.startswith(b'OggS')
+            )
+
     @api.constrains('volume')
     def _check_volume(self):
         for record in self:
@@ -191,18 +337,13 @@ class VoipHoldMusic(models.Model):
                 self.music_filename = 'hold_music.wav'
             
             # Update file size
-            self.file_size = len(self.music_file)
+            self.file_size = len(base64.b64decode(self.music_file))
             
             # Set format based on filename if not set
             if not self.format:
-                if self.music_filename.lower().endswith('.mp3'):
-                    self.format = 'mp3'
-                elif self.music_filename.lower().endswith('.wav'):
-                    self.format = 'wav'
-                elif self.music_filename.lower().endswith('.ogg'):
-                    self.format = 'ogg'
-                else:
-                    self.format = 'wav'  # Default to WAV
+                self.format = _format_from_filename(self.music_filename)
+            
+            self.duration = _audio_duration(self.music_file) or self.duration
             
             # Set quality based on file size
             if self.file_size < 100000:  # Less than 100KB
@@ -248,64 +389,89 @@ class VoipHoldMusic(models.Model):
     def _onchange_music_filename(self):
         """Handle filename change"""
         if self.music_filename and not self.format:
-            if self.music_filename.lower().endswith('.mp3'):
-                self.format = 'mp3'
-            elif self.music_filename.lower().endswith('.wav'):
-                self.format = 'wav'
-            elif self.music_filename.lower().endswith('.ogg'):
-                self.format = 'ogg'
-            else:
-                self.format = 'wav'
+            self.format = _format_from_filename(self.music_filename)
 
     @api.onchange('active')
     def _onchange_active(self):
         """Handle active change"""
         pass
 
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
         # Set default server if not provided
-        if 'server_id' not in vals:
+        without_server = [vals for vals in vals_list if 'server_id' not in vals]
+        if without_server:
             default_server = self.env['voip.server'].search([('active', '=', True)], limit=1)
-            if default_server:
-                vals['server_id'] = default_server.id
-            else:
+            if not default_server:
                 raise ValidationError(_('No active VoIP server found. Please create a VoIP server first.'))
+            for vals in without_server:
+                vals['server_id'] = default_server.id
+        
+        for vals in vals_list:
+            if vals.get('music_file') and not vals.get('duration'):
+                vals['duration'] = _audio_duration(vals['music_file']) or 0.0
         
         # Ensure only one default music per server
-        if vals.get('is_default', False):
-            server_id = vals.get('server_id')
-            if server_id:
-                self.env['voip.hold.music'].search([
-                    ('server_id', '=', server_id),
-                    ('is_default', '=', True)
-                ]).write({'is_default': False})
+        default_server_ids = [
+            vals['server_id'] for vals in vals_list if vals.get('is_default') and vals.get('server_id')
+        ]
+        self._check_single_default(default_server_ids)
+        self._unset_server_defaults(list(set(default_server_ids)))
         
-        return super(VoipHoldMusic, self).create(vals)
+        self.env.registry.clear_cache()
+        return super(VoipHoldMusic, self).create(vals_list)
 
     def write(self, vals):
         # Handle default music changes
-        if 'is_default' in vals and vals['is_default']:
-            for record in self:
-                self.env['voip.hold.music'].search([
-                    ('server_id', '=', record.server_id.id),
-                    ('is_default', '=', True),
-                    ('id', '!=', record.id)
-                ]).write({'is_default': False})
+        if vals.get('is_default'):
+            server_ids = [vals['server_id']] * len(self) if vals.get('server_id') else [
+                record.server_id.id for record in self
+            ]
+            self._check_single_default(server_ids)
+            self._unset_server_defaults(list(set(server_ids)), self.ids)
+        
+        # A new upload replaces the original kept by action_compress_music()
+        if 'music_file' in vals and 'music_file_original' not in vals:
+            vals = dict(vals, music_file_original=False)
+        if vals.get('music_file') and 'duration' not in vals:
+            duration = _audio_duration(vals['music_file'])
+            if duration:
+                vals = dict(vals, duration=duration)
         
+        # The cached lookups only depend on which music is listed, and in
+        # which order; counters and playback settings leave them untouched
+        if _MUSIC_LOOKUP_FIELDS & vals.keys():
+            self.env.registry.clear_cache()
         return super(VoipHoldMusic, self).write(vals)
 
+    def unlink(self):
+        self.env.registry.clear_cache()
+        return super(VoipHoldMusic, self).unlink()
+
+    def _check_single_default(self, server_ids):
+        """Refuse to make several music the default of the same server at once"""
+        if len(server_ids) != len(set(server_ids)):
+            raise ValidationError(_('Only one hold music can be the default of a VoIP server.'))
+
+    def _unset_server_defaults(self, server_ids, except_ids=()):
+        """Clear the default flag of the music of server_ids, but except_ids, with one UPDATE"""
+        if not server_ids:
+            return
+        self.flush_model(['server_id', 'is_default'])
+        self.env.cr.execute(SQL(
+            """UPDATE voip_hold_music
+                  SET is_default = FALSE, write_uid = %s, write_date = NOW() AT TIME ZONE 'UTC'
+                WHERE is_default AND server_id IN %s AND id != ALL(%s)
+            RETURNING id""",
+            self.env.uid, tuple(server_ids), list(except_ids),
+        ))
+        unset_ids = [music_id for music_id, in self.env.cr.fetchall()]
+        self.browse(unset_ids).invalidate_recordset(['is_default', 'write_uid', 'write_date'])
+
     def action_set_default(self):
         """Set this music as the default for its server"""
         self.ensure_one()
-        # Unset other defaults for the same server
-        self.env['voip.hold.music'].search([
-            ('server_id', '=', self.server_id.id),
-            ('is_default', '=', True),
-            ('id', '!=', self.id)
-        ]).write({'is_default': False})
-        
-        # Set this as default
+        # Set this as default; write() unsets the other defaults of the server
         self.write({'is_default': True})
         
         return {
@@ -370,13 +536,103 @@ class VoipHoldMusic(models.Model):
             }
         }
 
-    def action_increment_usage(self):
-        """Increment usage count and update last used time"""
+    def action_compress_music(self):
+        """Queue the music files for re-encoding to Opus
+
+        The encoding runs in the ir_cron_voip_hold_music_compress cron, so
+        a long ffmpeg run never holds the HTTP worker of the button click.
+        """
+        if not shutil.which('ffmpeg'):
+            raise UserError(_('ffmpeg is required to compress hold music but was not found on the server.'))
+        if not all(record.music_file_original or record.music_file for record in self):
+            raise UserError(_('No music file to compress'))
+        self.write({'compression_pending': True})
+        cron = self.env.ref('voip_webrtc_freepbx.ir_cron_voip_hold_music_compress', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Compression Scheduled'),
+                'message': _('The music will be re-encoded in the background.'),
+                'type': 'info',
+            }
+        }
+
+    @api.model
+    def _cron_compress_music(self):
+        """Compress the next music queued by action_compress_music()
+
+        One music per run, committed before ffmpeg starts: a run killed by
+        the cron time limit does not retry the same file forever. The cron
+        triggers itself again while more music is queued.
+        """
+        music = self.search([('compression_pending', '=', True)], limit=2)
+        if not music:
+            return
+        record = music[0]
+        record.compression_pending = False
+        self.env.cr.commit()
+        try:
+            record._compress_music_file()
+        except Exception:
+            self.env.cr.rollback()
+            _logger.exception("❌ Could not compress hold music %s", record.name)
+        if len(music) > 1:
+            self.env.ref('voip_webrtc_freepbx.ir_cron_voip_hold_music_compress')._trigger()
+
+    def _compress_music_file(self):
+        """Re-encode the music file to 64 kbps mono Opus
+
+        64 kbps is the "Low" quality of the quality field; mono at Opus'
+        native 48 kHz keeps the music intact for wideband WebRTC legs while
+        cutting WAV uploads to a fraction of their size. The upload is kept
+        in music_file_original and is always the encoder input.
+        """
         self.ensure_one()
+        ffmpeg = shutil.which('ffmpeg')
+        if not ffmpeg:
+            raise UserError(_('ffmpeg is required to compress hold music but was not found on the server.'))
+        source = self.music_file_original or self.music_file
+        if not source:
+            raise UserError(_('No music file to compress'))
+        with tempfile.NamedTemporaryFile() as tmp:
+            tmp.write(base64.b64decode(source))
+            tmp.flush()
+            result = subprocess.run(
+                [ffmpeg, '-nostdin', '-loglevel', 'error', '-i', tmp.name,
+                 '-c:a', 'libopus', '-b:a', '64k', '-ac', '1',
+                 '-f', 'ogg', 'pipe:1'],
+                capture_output=True, timeout=300, check=False,
+            )
+        if result.returncode or not result.stdout:
+            raise UserError(_('Could not compress %(name)s: %(error)s',
+                              name=self.name,
+                              error=result.stderr.decode(errors='replace').strip()))
         self.write({
-            'usage_count': self.usage_count + 1,
-            'last_used': fields.Datetime.now()
+            'music_file': base64.b64encode(result.stdout),
+            'music_file_original': source,
+            'music_filename': f"{os.path.splitext(self.music_filename or 'hold_music')[0]}.ogg",
+            'format': 'ogg',
+            'quality': 'low',
         })
+        _logger.info("🎵 Compressed hold music %s: %s -> %s bytes",
+                     self.name, len(source) * 3 // 4, len(result.stdout))
+
+    def action_increment_usage(self):
+        """Increment usage count and update last used time
+
+        Done with an atomic UPDATE so concurrent playbacks neither lose
+        increments nor go through the ORM write (and its write_date bump).
+        """
+        if not self:
+            return
+        self.env.cr.execute(
+            "UPDATE voip_hold_music SET usage_count = usage_count + 1, last_used = %s WHERE id = ANY(%s)",
+            (fields.Datetime.now(), self.ids)
+        )
+        self.invalidate_recordset(['usage_count', 'last_used'])
 
     def get_music_url(self):
         """Get the URL for this hold music file"""
@@ -386,67 +642,82 @@ class VoipHoldMusic(models.Model):
     def get_music_config(self):
         """Get configuration for this hold music"""
         self.ensure_one()
-        return {
-            'id': self.id,
-            'name': self.name,
-            'description': self.description,
-            'url': self.get_music_url(),
-            'volume': self.volume,
-            'loop': self.loop,
-            'fade_in': self.fade_in,
-            'fade_out': self.fade_out,
-            'duration': self.duration,
-            'format': self.format,
-            'quality': self.quality,
-            'tags': self.tags.split(',') if self.tags else [],
-            'is_default': self.is_default,
-        }
+        return self._read_music_configs()[0]
+
+    def _read_music_configs(self):
+        """Return the configuration of every record, fetched with a single read"""
+        configs = self.read(_MUSIC_CONFIG_FIELDS)
+        for config in configs:
+            config['url'] = f"/voip_webrtc_freepbx/hold_music/file/{config['id']}"
+            config['tags'] = config['tags'].split(',') if config['tags'] else []
+        return configs
 
     @api.model
     def get_available_music(self, server_id=None):
         """Get list of available hold music for a server"""
         try:
-            domain = [('active', '=', True)]
-            if server_id:
-                domain.append(('server_id', '=', server_id))
-            
-            # First try to get uploaded music files (priority)
-            uploaded_domain = domain + [('music_file', '!=', False)]
-            music_records = self.search(uploaded_domain, order='sequence, name')
-            
-            # If no uploaded files, get all music
-            if not music_records:
-                music_records = self.search(domain, order='sequence, name')
-            
-            return [music.get_music_config() for music in music_records if music.exists()]
+            return self.browse(self._get_available_music_ids(server_id or None))._read_music_configs()
         except Exception as e:
             _logger.warning(f"Error getting available music: {e}")
             return []
 
+    @api.model
+    @tools.ormcache('server_id')
+    def _get_available_music_ids(self, server_id):
+        """Return the ids of the available music of server_id, in display order
+
+        Cached per registry; the cache is cleared on create and unlink, and
+        on writes of _MUSIC_LOOKUP_FIELDS. Only ids are cached: the configs
+        are read for each call, in the caller's language and access rights.
+        """
+        domain = [('active', '=', True)]
+        if server_id:
+            domain.append(('server_id', '=', server_id))
+        
+        # First try to get uploaded music files (priority)
+        uploaded_domain = domain + [('music_file', '!=', False)]
+        music_records = self.sudo().search(uploaded_domain, order='sequence, name')
+        
+        # If no uploaded files, get all music
+        if not music_records:
+            music_records = self.sudo().search(domain, order='sequence, name')
+        
+        return tuple(music_records.ids)
+
     @api.model
     def get_default_music(self, server_id=None):
         """Get the default hold music for a server"""
         try:
-            domain = [('active', '=', True), ('is_default', '=', True)]
-            if server_id:
-                domain.append(('server_id', '=', server_id))
-            
-            default_music = self.search(domain, limit=1)
-            if default_music and default_music.exists():
-                return default_music.get_music_config()
-            
-            # Fallback to first available music
-            fallback_domain = [('active', '=', True)]
-            if server_id:
-                fallback_domain.append(('server_id', '=', server_id))
-            
-            fallback = self.search(fallback_domain, limit=1)
-            if fallback and fallback.exists():
-                return fallback.get_music_config()
-            
-            return None
+            music_id = self._get_default_music_id(server_id or None)
+            return self.browse(music_id).get_music_config() if music_id else None
         except Exception as e:
             _logger.warning(f"Error getting default music: {e}")
             return None
 
+    @api.model
+    @tools.ormcache('server_id')
+    def _get_default_music_id(self, server_id):
+        """Return the id of the default music of server_id, or None
+
+        Cached like _get_available_music_ids().
+        """
+        domain = [('active', '=', True), ('is_default', '=', True)]
+        if server_id:
+            domain.append(('server_id', '=', server_id))
+        
+        default_music = self.sudo().search(domain, limit=1)
+        if default_music:
+            return default_music.id
+        
+        # Fallback to first available music
+        fallback_domain = [('active', '=', True)]
+        if server_id:
+            fallback_domain.append(('server_id', '=', server_id))
+        
+        fallback = self.sudo().search(fallback_domain, limit=1)
+        if fallback:
+            return fallback.id
+        
+        return None
+
 
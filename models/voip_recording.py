@@ -1,10 +1,16 @@
-from odoo import models, fields, api, _
+from odoo import models, fields, api, Command, _
 from odoo.exceptions import ValidationError, UserError
 import base64
 import logging
 
 _logger = logging.getLogger(__name__)
 
+# Characters dropped from phone numbers before matching partners and SIP users
+_PHONE_STRIP = str.maketrans('', '', ' -()+\t')
+
+# File size units, each 1024 times the previous one
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
 
 class VoipRecording(models.Model):
     _name = 'voip.recording'
@@ -98,7 +104,8 @@ class VoipRecording(models.Model):
     
     file_size_display = fields.Char(
         string='Size',
-        compute='_compute_file_size_display'
+        compute='_compute_file_size_display',
+        store=True
     )
     
     duration = fields.Float(
@@ -108,7 +115,8 @@ class VoipRecording(models.Model):
     
     duration_display = fields.Char(
         string='Duration',
-        compute='_compute_duration_display'
+        compute='_compute_duration_display',
+        store=True
     )
     
     recording_type = fields.Selection([
@@ -151,46 +159,89 @@ class VoipRecording(models.Model):
     @api.model_create_multi
     def create(self, vals_list):
         """Override create to automatically populate caller and callee information"""
+        calls = self.env['voip.call'].browse(
+            {vals['call_id'] for vals in vals_list if vals.get('call_id')}
+        ).exists()
+        parties = {}
+        if calls:
+            # External numbers of every call, resolved together
+            parties = self._identify_parties({
+                number
+                for call in calls
+                for number, is_internal in (
+                    (call.from_number, call.direction == 'outbound'),
+                    (call.to_number, call.direction == 'inbound'),
+                )
+                if number and not (is_internal and call.odoo_user_id)
+            })
         for vals in vals_list:
-            if vals.get('call_id'):
-                call = self.env['voip.call'].browse(vals['call_id'])
-                _logger.info('🔧 VoIP Recording Debug: Creating recording for call_id=%s', vals['call_id'])
-                
-                if call.exists():
-                    _logger.info('🔧 VoIP Recording Debug: Call found - from_number=%s, to_number=%s, direction=%s, odoo_user_id=%s', 
-                                call.from_number, call.to_number, call.direction, call.odoo_user_id.id if call.odoo_user_id else None)
-                    
-                    # Populate caller and callee based on call direction
-                    caller_info = self._identify_caller_callee(call.from_number, call.direction == 'outbound', call.odoo_user_id)
-                    callee_info = self._identify_caller_callee(call.to_number, call.direction == 'inbound', call.odoo_user_id)
-                    
-                    _logger.info('🔧 VoIP Recording Debug: Caller info: %s', caller_info)
-                    _logger.info('🔧 VoIP Recording Debug: Callee info: %s', callee_info)
-                    
-                    # Set caller fields
-                    if not vals.get('caller_user_id') and caller_info.get('user_id'):
-                        vals['caller_user_id'] = caller_info['user_id']
-                    if not vals.get('caller_partner_id') and caller_info.get('partner_id'):
-                        vals['caller_partner_id'] = caller_info['partner_id']
-                    
-                    # Set callee fields
-                    if not vals.get('callee_user_id') and callee_info.get('user_id'):
-                        vals['callee_user_id'] = callee_info['user_id']
-                    if not vals.get('callee_partner_id') and callee_info.get('partner_id'):
-                        vals['callee_partner_id'] = callee_info['partner_id']
-                    
-                    _logger.info('🔧 VoIP Recording Debug: Final vals - caller_user_id=%s, caller_partner_id=%s, callee_user_id=%s, callee_partner_id=%s',
-                                vals.get('caller_user_id'), vals.get('caller_partner_id'), vals.get('callee_user_id'), vals.get('callee_partner_id'))
-                else:
-                    _logger.warning('🔧 VoIP Recording Debug: Call with ID %s not found!', vals['call_id'])
+            if not vals.get('call_id'):
+                continue
+            call = calls.browse(vals['call_id'])
+            if call not in calls:
+                _logger.warning('🔧 VoIP Recording Debug: Call with ID %s not found!', vals['call_id'])
+                continue
+            
+            # Populate caller and callee based on call direction
+            caller_info = self._get_party_info(parties, call.from_number, call.direction == 'outbound', call.odoo_user_id)
+            callee_info = self._get_party_info(parties, call.to_number, call.direction == 'inbound', call.odoo_user_id)
+            
+            # Set caller fields
+            if not vals.get('caller_user_id') and caller_info.get('user_id'):
+                vals['caller_user_id'] = caller_info['user_id']
+            if not vals.get('caller_partner_id') and caller_info.get('partner_id'):
+                vals['caller_partner_id'] = caller_info['partner_id']
+            
+            # Set callee fields
+            if not vals.get('callee_user_id') and callee_info.get('user_id'):
+                vals['callee_user_id'] = callee_info['user_id']
+            if not vals.get('callee_partner_id') and callee_info.get('partner_id'):
+                vals['callee_partner_id'] = callee_info['partner_id']
+            
+            _logger.debug('🔧 VoIP Recording Debug: Call %s - caller=%s, callee=%s', call.id, caller_info, callee_info)
         
         return super(VoipRecording, self).create(vals_list)
     
-    def _identify_caller_callee(self, phone_number, is_internal, odoo_user):
+    def _set_recording_file_raw(self, raw, mimetype=None):
+        """Store raw audio bytes as the recording_file attachment
+
+        Writing the Binary field would require base64-encoding the upload only
+        for the ORM to decode it again; the attachment backing the field is
+        written directly from the raw bytes instead. Passing mimetype spares
+        ir.attachment from sniffing the content. As this bypasses the ORM
+        write, the fields depending on recording_file are marked modified
+        explicitly.
+        """
+        self.ensure_one()
+        vals = {'raw': raw}
+        if mimetype:
+            vals['mimetype'] = mimetype
+        Attachment = self.env['ir.attachment'].sudo()
+        attachment = Attachment.search([
+            ('res_model', '=', self._name),
+            ('res_field', '=', 'recording_file'),
+            ('res_id', '=', self.id),
+        ], limit=1)
+        if attachment:
+            attachment.write(vals)
+        else:
+            Attachment.create(dict(vals, **{
+                'name': 'recording_file',
+                'res_model': self._name,
+                'res_field': 'recording_file',
+                'res_id': self.id,
+                'type': 'binary',
+            }))
+        self.invalidate_recordset(['recording_file'])
+        self.modified(['recording_file'])
+    
+    @api.model
+    def _get_party_info(self, parties, phone_number, is_internal, odoo_user):
         """
         Identify if a phone number belongs to an internal user or external partner
         
         Args:
+            parties: Result of _identify_parties() for the external numbers
             phone_number: Phone number to identify
             is_internal: True if this is the internal party (VoIP user)
             odoo_user: The Odoo user associated with the call
@@ -198,55 +249,49 @@ class VoipRecording(models.Model):
         Returns:
             dict: {'user_id': int or False, 'partner_id': int or False}
         """
-        _logger.info('🔧 VoIP Recording Debug: _identify_caller_callee called with phone_number=%s, is_internal=%s, odoo_user=%s',
-                    phone_number, is_internal, odoo_user.id if odoo_user else None)
-        
-        result = {'user_id': False, 'partner_id': False}
-        
         if not phone_number:
-            _logger.info('🔧 VoIP Recording Debug: No phone number provided, returning empty result')
-            return result
+            return {'user_id': False, 'partner_id': False}
         
         # If this is the internal party, link to the Odoo user
         if is_internal and odoo_user:
-            result['user_id'] = odoo_user.id
-            _logger.info('🔧 VoIP Recording Debug: Internal party identified as user_id=%s', odoo_user.id)
-            return result
+            return {'user_id': odoo_user.id, 'partner_id': False}
         
-        # Otherwise, search for external partner by phone number
-        clean_phone = phone_number.replace(' ', '').replace('-', '').replace('(', '').replace(')', '').replace('+', '')
-        _logger.info('🔧 VoIP Recording Debug: Searching for partner with phone=%s (clean=%s)', phone_number, clean_phone)
+        return parties.get(phone_number, {'user_id': False, 'partner_id': False})
+    
+    @api.model
+    def _identify_parties(self, phone_numbers):
+        """
+        Identify external phone numbers with one partner and one VoIP user lookup
         
-        # Search for partner with matching phone or mobile
-        partner = self.env['res.partner'].search([
-            '|', '|',
-            ('phone', 'ilike', clean_phone),
-            ('mobile', 'ilike', clean_phone),
-            ('phone', '=', phone_number)
-        ], limit=1)
+        Returns:
+            dict: {phone_number: {'user_id': int or False, 'partner_id': int or False}}
+        """
+        parties = {}
+        if not phone_numbers:
+            return parties
         
-        if partner:
-            result['partner_id'] = partner.id
-            _logger.info('🔧 VoIP Recording Debug: Partner found: %s (id=%s)', partner.name, partner.id)
-        else:
-            _logger.info('🔧 VoIP Recording Debug: No partner found with phone number')
+        # Search for partners with matching phone or mobile
+        partners = self.env['res.partner']._voip_find_by_phones(phone_numbers)
+        for phone_number, partner in partners.items():
+            parties[phone_number] = {'user_id': False, 'partner_id': partner.id}
         
-        # Also check if the phone number belongs to a VoIP user (internal SIP username)
-        if not result['partner_id']:
-            _logger.info('🔧 VoIP Recording Debug: Searching for VoIP user with sip_username=%s', clean_phone)
-            voip_user = self.env['voip.user'].search([
-                '|',
-                ('sip_username', '=', phone_number),
-                ('sip_username', '=', clean_phone)
-            ], limit=1)
-            
-            if voip_user and voip_user.user_id:
-                result['user_id'] = voip_user.user_id.id
-                _logger.info('🔧 VoIP Recording Debug: VoIP user found: %s (user_id=%s)', voip_user.name, voip_user.user_id.id)
-            else:
-                _logger.info('🔧 VoIP Recording Debug: No VoIP user found with sip_username')
+        # Also check if the other numbers belong to a VoIP user (internal SIP username)
+        remaining = {number: number.translate(_PHONE_STRIP) for number in phone_numbers if number not in partners}
+        if remaining:
+            voip_users = self.env['voip.user'].search([
+                ('sip_username', 'in', list({*remaining, *remaining.values()})),
+            ])
+            user_by_username = {}
+            for voip_user in voip_users:
+                if voip_user.user_id:
+                    user_by_username.setdefault(voip_user.sip_username, voip_user.user_id.id)
+            for number, clean_phone in remaining.items():
+                user_id = user_by_username.get(number) or user_by_username.get(clean_phone)
+                if user_id:
+                    parties[number] = {'user_id': user_id, 'partner_id': False}
         
-        return result
+        _logger.debug('🔧 VoIP Recording Debug: Identified %s of %s numbers', len(parties), len(phone_numbers))
+        return parties
     
     @api.depends('caller_user_id', 'caller_partner_id', 'callee_user_id', 'callee_partner_id', 'call_id.from_number', 'call_id.to_number')
     def _compute_caller_callee_display(self):
@@ -273,8 +318,9 @@ class VoipRecording(models.Model):
     
     @api.depends('recording_file', 'recording_filename')
     def _compute_recording_url(self):
-        for record in self:
-            if record.recording_file and record.id:
+        # bin_size: only check that the file exists, without loading it
+        for record, sized in zip(self, self.with_context(bin_size=True)):
+            if sized.recording_file and record.id:
                 record.recording_url = f'/web/content/voip.recording/{record.id}/recording_file/{record.recording_filename or "recording.webm"}'
             else:
                 record.recording_url = False
@@ -284,11 +330,8 @@ class VoipRecording(models.Model):
         for record in self:
             if record.file_size:
                 size = record.file_size
-                for unit in ['B', 'KB', 'MB', 'GB']:
-                    if size < 1024.0:
-                        record.file_size_display = f"{size:.2f} {unit}"
-                        break
-                    size /= 1024.0
+                exponent = min((size.bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+                record.file_size_display = f"{size / (1 << 10 * exponent):.2f} {_SIZE_UNITS[exponent]}"
             else:
                 record.file_size_display = '0 B'
 
@@ -296,9 +339,8 @@ class VoipRecording(models.Model):
     def _compute_duration_display(self):
         for record in self:
             if record.duration:
-                hours = int(record.duration // 3600)
-                minutes = int((record.duration % 3600) // 60)
-                seconds = int(record.duration % 60)
+                minutes, seconds = divmod(int(record.duration), 60)
+                hours, minutes = divmod(minutes, 60)
                 
                 if hours > 0:
                     record.duration_display = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
@@ -320,7 +362,7 @@ class VoipRecording(models.Model):
 
     def action_download_recording(self):
         self.ensure_one()
-        if not self.recording_file:
+        if not self.with_context(bin_size=True).recording_file:
             raise UserError(_('No recording file available for download.'))
         
         return {
@@ -331,7 +373,7 @@ class VoipRecording(models.Model):
 
     def action_play_recording(self):
         self.ensure_one()
-        if not self.recording_file:
+        if not self.with_context(bin_size=True).recording_file:
             raise UserError(_('No recording file available to play.'))
         
         return {
@@ -342,13 +384,14 @@ class VoipRecording(models.Model):
 
     def share_with_users(self, user_ids):
         self.ensure_one()
-        self.shared_with_ids = [(4, user_id) for user_id in user_ids]
+        users = self.env['res.users'].browse(user_ids)
+        self.shared_with_ids = [Command.link(user_id) for user_id in users.ids]
         
-        # Send notification to shared users
-        for user in self.env['res.users'].browse(user_ids):
+        # Notify all shared users with a single message
+        if users:
             self.message_post(
-                body=_('Recording shared with %s', user.name),
-                partner_ids=user.partner_id.ids,
+                body=_('Recording shared with %s', ', '.join(users.mapped('name'))),
+                partner_ids=users.partner_id.ids,
                 subtype_xmlid='mail.mt_note'
             )
 
@@ -29,8 +29,9 @@
 # ---------------------------------------------------------------------------
 # © 2025 — All Rights Reserved — Mohamed Samir Abouelez 
 #################################################################################
-from odoo import models, fields, api, _
-from odoo.exceptions import ValidationError
+from odoo import models, fields, api, tools, _
+import hashlib
+import json
 import logging
 import secrets
 from ..utils.logging_utils import VoipLoggingUtils
@@ -67,17 +68,32 @@ class VoipServer(models.Model):
     api_key = fields.Char(
         string='API Key',
         required=False,
-        tracking=True,
         copy=False,
-        default=lambda self: self._generate_api_key(),
         help='Unique API key for webhook authentication. This key must be sent in X-API-Key header when calling the webhook endpoint. Auto-generated if not provided.'
     )
     
+    api_key_fingerprint = fields.Char(
+        string='API Key Fingerprint',
+        compute='_compute_api_key_fingerprint',
+        store=True,
+        index='btree_not_null',
+        copy=False,
+        groups='base.group_system',
+        help='SHA-256 of the API key, used to authenticate webhooks without comparing the key itself'
+    )
+    
     hold_music_config = fields.Text(
         string='Hold Music Configuration',
         help='JSON configuration for hold music files. Format: {"music_files": [{"id": "1", "name": "Music Name", "file_path": "/path/to/file.wav"}]}'
     )
     
+    hold_music_parsed = fields.Json(
+        string='Parsed Hold Music Configuration',
+        compute='_compute_hold_music_parsed',
+        store=True,
+        help='hold_music_config parsed once on save, empty if it is not valid JSON'
+    )
+    
     port = fields.Integer(
         string='SIP Port',
         default=5060,
@@ -162,50 +178,157 @@ class VoipServer(models.Model):
         tracking=True,
         help='Production: Enable all logging. Test: Disable all logging for testing purposes.'
     )
+    
+    event_store_mode = fields.Selection(
+        [('all', 'All Events'), ('filtered', 'Selected Event Types'), ('off', 'None')],
+        string='Event Log',
+        default='all',
+        required=True,
+        tracking=True,
+        help='Which PBX webhook events are saved as VoIP events. All events are '
+             'saved by default; select event types to keep the log smaller. '
+             'User status updates are applied in every mode.'
+    )
+    
+    event_store_filter = fields.Char(
+        string='Stored Event Types',
+        default='Newchannel,Hangup,PeerStatus,Bridge',
+        help='Comma-separated AMI event types saved when the event log is set to selected event types'
+    )
+
+    _sql_constraints = [
+        ('api_key_unique', 'unique(api_key)',
+         'API Key must be unique across servers!')
+    ]
 
     @api.model
     def _generate_api_key(self):
         """Generate a secure random API key"""
         return secrets.token_urlsafe(32)
     
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Auto-generate API keys if not provided"""
+        for vals in vals_list:
+            if not vals.get('api_key'):
+                vals['api_key'] = self._generate_api_key()
+        self.env.registry.clear_cache()
+        return super(VoipServer, self).create(vals_list)
+    
+    def write(self, vals):
+        """Invalidate the server caches when keys, names, activity, logging or event log settings change"""
+        if {'api_key', 'name', 'active', 'logging_mode', 'event_store_mode', 'event_store_filter'} & vals.keys():
+            self.env.registry.clear_cache()
+        return super(VoipServer, self).write(vals)
+    
+    def unlink(self):
+        self.env.registry.clear_cache()
+        return super(VoipServer, self).unlink()
+    
+    @api.model
+    @tools.ormcache()
+    def _get_api_key_index(self):
+        """Return a read-only map of API key fingerprint to (id, name) of active servers
+
+        Built from the stored fingerprints, so neither the query nor the
+        cache ever hold keys in plain text, and unknown keys cannot add
+        entries to it. Cached per registry; the cache is cleared on create,
+        write and unlink.
+        """
+        self.env.cr.execute("""
+            SELECT api_key_fingerprint, id, name
+              FROM voip_server
+             WHERE active AND api_key_fingerprint IS NOT NULL
+        """)
+        return tools.frozendict({
+            fingerprint: (server_id, name)
+            for fingerprint, server_id, name in self.env.cr.fetchall()
+        })
+
+    @api.model
+    def _hash_api_key(self, api_key):
+        """Return the SHA-256 fingerprint of api_key
+
+        API keys are 256-bit random tokens, so a plain hash cannot be
+        reversed; unlike a keyed hash it stays valid when the database is
+        duplicated or its secret is rotated.
+        """
+        return hashlib.sha256(api_key.encode()).hexdigest()
+
+    @api.depends('api_key')
+    def _compute_api_key_fingerprint(self):
+        for record in self:
+            record.api_key_fingerprint = record.api_key and self._hash_api_key(record.api_key)
+
+    @api.model
+    def _get_server_by_api_key(self, api_key):
+        """Return (id, name) of the active server owning api_key, or (False, False)"""
+        if not api_key:
+            return (False, False)
+        return self._get_api_key_index().get(self._hash_api_key(api_key), (False, False))
+    
     @api.model
-    def create(self, vals):
-        """Auto-generate API key if not provided"""
-        if not vals.get('api_key'):
-            vals['api_key'] = self._generate_api_key()
-        return super(VoipServer, self).create(vals)
+    @tools.ormcache('server_id')
+    def _get_stored_event_types(self, server_id):
+        """Return the frozenset of event types server_id stores, None for all"""
+        server = self.sudo().browse(server_id)
+        if server.event_store_mode == 'all':
+            return None
+        if server.event_store_mode == 'off':
+            return frozenset()
+        return frozenset(
+            event_type.strip()
+            for event_type in (server.event_store_filter or '').split(',')
+            if event_type.strip()
+        )
+
+    @api.model
+    @tools.ormcache('server_id')
+    def _get_logging_mode(self, server_id):
+        """Return the logging mode of server_id, or of the first active server when not given"""
+        domain = [('id', '=', server_id)] if server_id else [('active', '=', True)]
+        server = self.sudo().with_context(active_test=False).search_fetch(domain, ['logging_mode'], limit=1)
+        return server.logging_mode or 'production'
+
+    @api.model
+    def _should_store_event(self, server_id, event_type):
+        """Return whether a webhook event of event_type from server_id is saved"""
+        event_types = self._get_stored_event_types(server_id)
+        return event_types is None or event_type in event_types
     
+    def _count_per_server(self, model_name):
+        """Return {server id: count} of the model_name records of the batch, in one grouped query"""
+        if not self.ids:
+            return {}
+        return {
+            server.id: count
+            for server, count in self.env[model_name]._read_group(
+                [('server_id', 'in', self.ids)], ['server_id'], ['__count'],
+            )
+        }
+
     @api.depends('user_ids')
     def _compute_user_count(self):
+        counts = self._count_per_server('voip.user')
         for record in self:
-            record.user_count = len(record.user_ids)
+            record.user_count = counts.get(record.id, 0) if record.id else len(record.user_ids)
 
     @api.depends('call_ids')
     def _compute_call_count(self):
+        counts = self._count_per_server('voip.call')
         for record in self:
-            record.call_count = len(record.call_ids)
+            record.call_count = counts.get(record.id, 0) if record.id else len(record.call_ids)
 
-    @api.constrains('host', 'websocket_url')
-    def _check_server_config(self):
-        for record in self:
-            if not record.host:
-                raise ValidationError(_('Server host is required.'))
-            if not record.websocket_url:
-                raise ValidationError(_('WebSocket URL is required.'))
-    
-    @api.constrains('api_key')
-    def _check_api_key_unique(self):
-        """Ensure API key is unique across all servers"""
+    @api.depends('hold_music_config')
+    def _compute_hold_music_parsed(self):
         for record in self:
-            if record.api_key:
-                duplicate = self.search([
-                    ('api_key', '=', record.api_key),
-                    ('id', '!=', record.id)
-                ], limit=1)
-                if duplicate:
-                    raise ValidationError(_(
-                        'API Key must be unique! Server "%s" is already using this API key.'
-                    ) % duplicate.name)
+            parsed = {}
+            if record.hold_music_config:
+                try:
+                    parsed = json.loads(record.hold_music_config)
+                except ValueError as e:
+                    _logger.warning("⚠️ Invalid hold music config on server %s: %s", record.name, e)
+            record.hold_music_parsed = parsed if isinstance(parsed, dict) else {}
 
     def action_test_connection(self):
         self.ensure_one()
@@ -29,8 +29,9 @@
 # ---------------------------------------------------------------------------
 # © 2025 — All Rights Reserved — Mohamed Samir Abouelez 
 #################################################################################
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError
+from datetime import datetime, time, timedelta
 import logging
 from ..utils.logging_utils import VoipLoggingUtils
 
@@ -42,6 +43,14 @@ class VoipUser(models.Model):
     _description = 'VoIP User Configuration'
     _inherit = ['mail.thread', 'mail.activity.mixin']
 
+    # Fields read by get_voip_config(), so callers can fetch them in one query
+    _voip_config_fields = [
+        'name', 'user_id', 'server_id', 'sip_username', 'sip_password', 'display_name',
+        'auto_answer', 'ring_tone', 'enable_recording', 'auto_start_recording',
+        'can_control_recording', 'recording_quality', 'recording_format',
+    ]
+    _voip_config_server_fields = ['name', 'host', 'websocket_url', 'port', 'realm', 'use_tls', 'logging_mode']
+
     name = fields.Char(
         string='Name',
         compute='_compute_name',
@@ -98,7 +107,7 @@ class VoipUser(models.Model):
         ('busy', 'Busy'),
         ('offline', 'Offline'),
         ('away', 'Away'),
-    ], string='Status', default='available', tracking=True)
+    ], string='Status', default='available')
     
     auto_answer = fields.Boolean(
         string='Auto Answer',
@@ -192,24 +201,23 @@ class VoipUser(models.Model):
     
     email = fields.Char(
         string='Email',
-        related='user_id.email',
-        store=True
+        related='user_id.email'
     )
     
     # Call statistics for Kanban
     today_calls = fields.Integer(
         string='Today Calls',
-        compute='_compute_today_stats'
+        compute='_compute_call_stats'
     )
     
     this_week_calls = fields.Integer(
         string='This Week Calls',
-        compute='_compute_week_stats'
+        compute='_compute_call_stats'
     )
     
     average_call_duration = fields.Float(
         string='Average Call Duration (min)',
-        compute='_compute_average_duration'
+        compute='_compute_call_stats'
     )
 
     _sql_constraints = [
@@ -217,8 +225,17 @@ class VoipUser(models.Model):
          'A user can only have one VoIP configuration per server!')
     ]
 
-    @api.depends('user_id', 'sip_username')
+    def init(self):
+        # PBX lookups are scoped to the server the event came from
+        tools.create_index(self.env.cr, 'voip_user_server_id_extension_index',
+                           self._table, ['server_id', 'extension'])
+        tools.create_index(self.env.cr, 'voip_user_server_id_sip_username_index',
+                           self._table, ['server_id', 'sip_username'])
+
+    @api.depends('user_id.name', 'sip_username')
     def _compute_name(self):
+        # Load the names of all linked users at once before the loop
+        self.user_id.fetch(['name'])
         for record in self:
             if record.user_id and record.sip_username:
                 record.name = f"{record.user_id.name} ({record.sip_username})"
@@ -227,15 +244,98 @@ class VoipUser(models.Model):
             else:
                 record.name = record.sip_username or 'New VoIP User'
 
-    @api.depends('call_ids', 'call_ids.direction', 'call_ids.duration')
+    @api.depends('call_ids', 'call_ids.direction', 'call_ids.duration', 'call_ids.start_time')
     def _compute_call_stats(self):
+        """Compute the kanban call statistics of the batch with two grouped reads
+
+        One read gives the counts and durations per direction, the other the
+        calls of the week per day. _read_group() applies the record rules on
+        voip.call, so users only see statistics of the calls they can read.
+        """
+        stats = {}
+        totals = {}
+        today_counts = {}
+        week_counts = {}
+        if self.ids:
+            Call = self.env['voip.call']
+            for user, direction, count, duration in Call._read_group(
+                [('user_id', 'in', self.ids)], ['user_id', 'direction'], ['__count', 'duration:sum'],
+            ):
+                stats[user.id, direction] = count
+                total_count, total_duration = totals.get(user.id, (0, 0.0))
+                totals[user.id] = (total_count + count, total_duration + (duration or 0.0))
+            # Today and this week from one read of the week's calls, per UTC
+            # day so the groups line up with the domain bounds
+            today = fields.Date.today()
+            week_start = today - timedelta(days=today.weekday())
+            for user, day, count in Call.with_context(tz='UTC')._read_group(
+                [('user_id', 'in', self.ids),
+                 ('start_time', '>=', datetime.combine(week_start, time.min))],
+                ['user_id', 'start_time:day'], ['__count'],
+            ):
+                week_counts[user.id] = week_counts.get(user.id, 0) + count
+                if fields.Date.to_date(day) == today:
+                    today_counts[user.id] = count
         for record in self:
-            incoming_calls = record.call_ids.filtered(lambda c: c.direction == 'inbound')
-            outgoing_calls = record.call_ids.filtered(lambda c: c.direction == 'outbound')
-            
-            record.incoming_calls_count = len(incoming_calls)
-            record.outgoing_calls_count = len(outgoing_calls)
-            record.total_call_duration = sum(record.call_ids.mapped('duration')) / 3600.0
+            count, duration = totals.get(record.id, (0, 0.0))
+            record.incoming_calls_count = stats.get((record.id, 'inbound'), 0)
+            record.outgoing_calls_count = stats.get((record.id, 'outbound'), 0)
+            record.today_calls = today_counts.get(record.id, 0)
+            record.this_week_calls = week_counts.get(record.id, 0)
+            record.total_call_duration = duration / 3600.0
+            record.average_call_duration = duration / count / 60.0 if count else 0.0
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.env.registry.clear_cache()
+        return super().create(vals_list)
+
+    def write(self, vals):
+        """Invalidate the extension index when a lookup key changes"""
+        if {'extension', 'sip_username', 'server_id', 'active'} & vals.keys():
+            self.env.registry.clear_cache()
+        return super().write(vals)
+
+    def unlink(self):
+        self.env.registry.clear_cache()
+        return super().unlink()
+
+    @api.model
+    @tools.ormcache('strict')
+    def _get_extension_index(self, strict=False):
+        """Return a read-only map of extension / SIP username to active user id
+
+        Each key is present both alone (any server) and as a
+        (server_id, key) pair. Extensions take precedence over SIP
+        usernames, and the oldest user wins on duplicates. When strict, an
+        extension only maps to a user whose SIP username contains it, as
+        the PBX status events always matched. Cached per registry; the
+        cache is cleared when a user is created, deleted or changes one of
+        the lookup keys.
+        """
+        self.env.cr.execute(
+            "SELECT id, server_id, extension, sip_username FROM voip_user WHERE active ORDER BY id"
+        )
+        by_extension = {}
+        by_username = {}
+        for user_id, server_id, extension, sip_username in self.env.cr.fetchall():
+            if extension and not (strict and extension.lower() not in (sip_username or '').lower()):
+                by_extension.setdefault(extension, user_id)
+                by_extension.setdefault((server_id, extension), user_id)
+            if sip_username:
+                by_username.setdefault(sip_username, user_id)
+                by_username.setdefault((server_id, sip_username), user_id)
+        return tools.frozendict({**by_username, **by_extension})
+
+    @api.model
+    def _get_user_by_extension(self, extension, server_id=None, strict=False):
+        """Return the active user whose extension or SIP username is extension
+
+        When server_id is given, only users of that server match. strict
+        also requires the SIP username to contain the extension.
+        """
+        key = (server_id, extension) if server_id else extension
+        return self.browse(self._get_extension_index(strict).get(key))
 
     def action_view_calls(self):
         self.ensure_one()
@@ -250,13 +350,16 @@ class VoipUser(models.Model):
 
     def get_voip_config(self):
         self.ensure_one()
+        server = self.server_id
+        # Load only the server fields used here, not its large text columns
+        server.fetch(self._voip_config_server_fields)
         return {
             'server': {
-                'host': self.server_id.host,
-                'websocket_url': self.server_id.websocket_url,
-                'port': self.server_id.port,
-                'realm': self.server_id.realm or self.server_id.host,
-                'use_tls': self.server_id.use_tls,
+                'host': server.host,
+                'websocket_url': server.websocket_url,
+                'port': server.port,
+                'realm': server.realm or server.host,
+                'use_tls': server.use_tls,
             },
             'user': {
                 'username': self.sip_username,
@@ -272,47 +375,41 @@ class VoipUser(models.Model):
             }
         }
 
+    def _set_status(self, status):
+        """Set the status of this user from a PBX event, skipping no-op updates
+
+        A single conditional UPDATE replaces reading the current status and
+        the ORM write for the many PBX events
+        that do not change anything. Returns (changed, previous status).
+        """
+        self.ensure_one()
+        if status not in dict(self._fields['status'].selection):
+            raise ValueError(f"Invalid VoIP user status: {status}")
+        self.flush_recordset(['status'])
+        self.env.cr.execute("""
+            UPDATE voip_user u
+               SET status = %s, write_uid = %s, write_date = NOW() AT TIME ZONE 'UTC'
+              FROM (SELECT id, status FROM voip_user WHERE id = %s FOR UPDATE) old
+             WHERE u.id = old.id AND old.status IS DISTINCT FROM %s
+         RETURNING old.status
+        """, (status, self.env.uid, self.id, status))
+        row = self.env.cr.fetchone()
+        if not row:
+            return False, status
+        self.invalidate_recordset(['status', 'write_uid', 'write_date'])
+        return True, row[0]
+
     def update_last_login(self):
         self.ensure_one()
-        self.last_login = fields.Datetime.now()
+        # Plain UPDATE: no tracking or write_date bump for a login timestamp
+        self.env.cr.execute(
+            "UPDATE voip_user SET last_login = %s WHERE id = %s",
+            (fields.Datetime.now(), self.id)
+        )
+        self.invalidate_recordset(['last_login'])
         # Log login update based on server logging mode
         VoipLoggingUtils.log_if_enabled(
             self.env, _logger, 'info', 
             'VoIP user %s logged in', self.name, 
             server_id=self.server_id.id
         )
-    
-    def toggle_active(self):
-        """Toggle active status of VoIP user"""
-        self.ensure_one()
-        self.active = not self.active
-        return True
-    
-    @api.depends('call_ids', 'call_ids.start_time')
-    def _compute_today_stats(self):
-        today = fields.Date.today()
-        for record in self:
-            today_calls = record.call_ids.filtered(
-                lambda c: c.start_time and c.start_time.date() == today
-            )
-            record.today_calls = len(today_calls)
-    
-    @api.depends('call_ids', 'call_ids.start_time')
-    def _compute_week_stats(self):
-        from datetime import datetime, timedelta
-        today = fields.Date.today()
-        week_start = today - timedelta(days=today.weekday())
-        for record in self:
-            week_calls = record.call_ids.filtered(
-                lambda c: c.start_time and c.start_time.date() >= week_start
-            )
-            record.this_week_calls = len(week_calls)
-    
-    @api.depends('call_ids', 'call_ids.duration')
-    def _compute_average_duration(self):
-        for record in self:
-            if record.call_ids:
-                total_duration = sum(record.call_ids.mapped('duration'))
-                record.average_call_duration = total_duration / len(record.call_ids) / 60.0
-            else:
-                record.average_call_duration = 0.0
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#################################################################################
+#
+# Module Name: Voip Webrtc Freepbx
+# Description: Establishes real-time VoIP communication between Odoo and FreePBX 
+#              using WebRTC and PJSIP for seamless browser-based calling integration.
+#
+# Copyright (c) 2025
+# Author: Mohamed Samir Abouelez 
+# Website: https://odoo-vip.com
+# Email: kenzey0man@gmail.com
+# Phone: +20 100 057 3614
+#
+# License: Odoo Proprietary License v1.0 (OPL-1)
+# License URL: https://www.odoo.com/documentation/master/legal/licenses.html#odoo-proprietary-license
+#
+# ---------------------------------------------------------------------------
+# ⚠️ Usage and Modification Restrictions:
+#
+# - This software is licensed under the Odoo Proprietary License (OPL-1).
+# - You are NOT permitted to modify, copy, redistribute, or reuse any part of
+#   this source code without the explicit written consent of the author.
+# - Partial use, extraction, reverse engineering, or integration of this code
+#   into other projects without authorization is strictly prohibited.
+# - Any commercial use or deployment must be approved directly by:
+#     Mohamed Samir Abouelez 
+#     Email: kenzey0man@gmail.com
+#
+# ---------------------------------------------------------------------------
+# © 2025 — All Rights Reserved — Mohamed Samir Abouelez 
+#################################################################################
+from odoo import models, fields, api
+from odoo.tools import SQL
+import logging
+from ..utils.json_utils import json_dumps, json_loads
+
+_logger = logging.getLogger(__name__)
+
+# Webhooks handled per cron run; the cron triggers itself again while more wait
+_QUEUE_BATCH_SIZE = 500
+
+
+class VoipWebhookQueue(models.Model):
+    """PBX webhook events acknowledged but not handled yet
+
+    The webhook routes only insert here and answer 202 Accepted; the
+    ir_cron_voip_webhook_queue cron stores and handles the events in
+    batches. Rows live in the database, so acknowledged events survive
+    worker restarts.
+    """
+    _name = 'voip.webhook.queue'
+    _description = 'VoIP Webhook Queue'
+    _order = 'id'
+    _log_access = False
+
+    server_id = fields.Many2one(
+        'voip.server',
+        string='VoIP Server',
+        required=True,
+        ondelete='cascade'
+    )
+    
+    payload = fields.Text(
+        string='Payload',
+        required=True,
+        help='Webhook object posted by the PBX, as JSON'
+    )
+    
+    received_at = fields.Datetime(
+        string='Received At',
+        required=True,
+        default=fields.Datetime.now
+    )
+
+    @api.model
+    def _enqueue(self, payloads, server_id):
+        """Queue the webhook payloads of server_id with one INSERT and wake the cron up"""
+        if not payloads:
+            return
+        self.env.cr.execute(SQL(
+            "INSERT INTO voip_webhook_queue (server_id, payload, received_at) VALUES %s",
+            SQL(', ').join(
+                SQL("(%s, %s, NOW() AT TIME ZONE 'UTC')", server_id, json_dumps(payload))
+                for payload in payloads
+            ),
+        ))
+        self._trigger_processing()
+
+    @api.model
+    def _trigger_processing(self):
+        cron = self.env.ref('voip_webrtc_freepbx.ir_cron_voip_webhook_queue', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _cron_process_queue(self, limit=_QUEUE_BATCH_SIZE):
+        """Store and handle the oldest queued webhooks, then remove them
+
+        Rows are locked with SKIP LOCKED so overlapping runs never handle
+        an event twice.
+        """
+        self.env.cr.execute(
+            """SELECT id, server_id, payload FROM voip_webhook_queue
+                ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED""",
+            (limit,)
+        )
+        rows = self.env.cr.fetchall()
+        if not rows:
+            return
+        events = []
+        for queue_id, server_id, payload in rows:
+            try:
+                events.append((json_loads(payload), server_id))
+            except ValueError:
+                _logger.error("❌ Dropped unreadable queued webhook %s", queue_id)
+        failed = self.env['voip.event'].sudo()._process_webhook_events(events)
+        self.env.cr.execute(
+            "DELETE FROM voip_webhook_queue WHERE id = ANY(%s)", ([row[0] for row in rows],)
+        )
+        _logger.info("📦 Handled %s queued webhook events (%s failed)", len(rows), failed)
+        if len(rows) == limit:
+            self._trigger_processing()
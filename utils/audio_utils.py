@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#################################################################################
+#
+# Module Name: VoIP Audio Utilities
+# Description: Synthesis of the built-in hold music melodies
+#
+# Copyright (c) 2025
+# Author: Mohamed Samir Abouelez 
+# Website: https://odoo-vip.com
+# Email: kenzey0man@gmail.com
+# Phone: +20 100 057 3614
+#
+# License: Odoo Proprietary License v1.0 (OPL-1)
+# License URL: https://www.odoo.com/documentation/master/legal/licenses.html#odoo-proprietary-license
+#
+# ---------------------------------------------------------------------------
+# ⚠️ Usage and Modification Restrictions:
+#
+# - This software is licensed under the Odoo Proprietary License (OPL-1).
+# - You are NOT permitted to modify, copy, redistribute, or reuse any part of
+#   this source code without the explicit written consent of the author.
+# - Partial use, extraction, reverse engineering, or integration of this code
+#   into other projects without authorization is strictly prohibited.
+# - Any commercial use or deployment must be approved directly by:
+#     Mohamed Samir Abouelez 
+#     Email: kenzey0man@gmail.com
+#
+# ---------------------------------------------------------------------------
+# © 2025 — All Rights Reserved — Mohamed Samir Abouelez 
+#################################################################################
+
+import base64
+import math
+import struct
+import sys
+import threading
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Notes of the built-in melody: A4, C5, E5, G5, E5, C5, A4, G4
+MELODY_FREQUENCIES = (440, 523.25, 659.25, 783.99, 659.25, 523.25, 440, 392)
+
+# Fundamental plus two overtones used for the default hold music
+HOLD_MUSIC_HARMONICS = ((1, 0.1), (2, 0.05), (3, 0.02))
+
+# Rendered melodies: (notes, duration, options) -> (wav bytes, base64 bytes)
+_MELODY_WAV_CACHE = {}
+_MELODY_WAV_LOCK = threading.Lock()
+
+
+class VoipAudioUtils:
+    """Utility class for generating hold music audio"""
+
+    @staticmethod
+    def render_melody_wav(notes, duration, sample_rate=44100, harmonics=((1, 0.1),),
+                          vibrato=0.0, restart_phase=False):
+        """
+        Render a melody as 16-bit mono PCM WAV
+
+        Args:
+            notes: list of (frequency in Hz, note duration in seconds)
+            duration: maximum length of the output in seconds
+            sample_rate: samples per second
+            harmonics: (multiple, amplitude) pairs summed for every note
+            vibrato: depth of a 5 Hz amplitude vibrato
+            restart_phase: restart the time axis at each note instead of
+                keeping one running clock for the whole melody
+
+        Returns:
+            bytes: the complete WAV file
+        """
+        total_samples = int(sample_rate * duration)
+        chunks = []
+        sample_index = 0
+        frame_count = 0
+
+        for note_freq, note_duration in notes:
+            end_index = min(sample_index + int(sample_rate * note_duration), total_samples)
+            start = 0 if restart_phase else sample_index
+            count = end_index - sample_index
+
+            if numpy is not None:
+                t = numpy.arange(start, start + count, dtype=numpy.float64) / sample_rate
+                wave_data = sum(numpy.sin(2 * numpy.pi * note_freq * multiple * t) * amplitude
+                                for multiple, amplitude in harmonics)
+                if vibrato:
+                    wave_data = wave_data * (1 + numpy.sin(2 * numpy.pi * 5 * t) * vibrato)
+                pcm = numpy.clip(wave_data * 32767, -32768, 32767).astype('<i2')
+                chunks.append(pcm)
+            else:
+                pcm = array('h')
+                for i in range(start, start + count):
+                    time = i / sample_rate
+                    sample = sum(math.sin(2 * math.pi * note_freq * multiple * time) * amplitude
+                                 for multiple, amplitude in harmonics)
+                    if vibrato:
+                        sample *= 1 + math.sin(2 * math.pi * 5 * time) * vibrato
+                    pcm.append(int(max(-32768, min(32767, sample * 32767))))
+                if sys.byteorder == 'big':
+                    pcm.byteswap()  # WAV samples are little-endian
+                chunks.append(pcm)
+
+            frame_count += count
+            sample_index = end_index
+            if sample_index >= total_samples:
+                break
+
+        # Mono 16-bit PCM: the 44-byte RIFF header is all the wave module
+        # would add. join() sizes the result once and copies each note's
+        # sample buffer straight into it, so no intermediate bytes are made
+        data_size = frame_count * 2
+        header = struct.pack(
+            '<4sI4s4sIHHIIHH4sI',
+            b'RIFF', 36 + data_size, b'WAVE',
+            b'fmt ', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+            b'data', data_size,
+        )
+        return b''.join([header, *chunks])
+
+    @staticmethod
+    def get_melody_wav(notes, duration, **options):
+        """
+        Return (wav bytes, base64 bytes) for a melody, rendering it only once
+
+        The output is deterministic, so it is kept for the lifetime of the
+        process. Takes the same arguments as render_melody_wav().
+        """
+        key = (tuple(notes), duration, tuple(sorted(options.items())))
+        cached = _MELODY_WAV_CACHE.get(key)
+        if cached is None:
+            with _MELODY_WAV_LOCK:
+                cached = _MELODY_WAV_CACHE.get(key)
+                if cached is None:
+                    wav_data = VoipAudioUtils.render_melody_wav(notes, duration, **options)
+                    # Binary fields accept base64 bytes, no need for a str copy
+                    cached = (wav_data, base64.b64encode(wav_data))
+                    _MELODY_WAV_CACHE[key] = cached
+        return cached
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#################################################################################
+#
+# Module Name: VoIP JSON Utilities
+# Description: JSON encoding helpers backed by orjson when available
+#
+# Copyright (c) 2025
+# Author: Mohamed Samir Abouelez 
+# Website: https://odoo-vip.com
+# Email: kenzey0man@gmail.com
+# Phone: +20 100 057 3614
+#
+# License: Odoo Proprietary License v1.0 (OPL-1)
+# License URL: https://www.odoo.com/documentation/master/legal/licenses.html#odoo-proprietary-license
+#
+# ---------------------------------------------------------------------------
+# ⚠️ Usage and Modification Restrictions:
+#
+# - This software is licensed under the Odoo Proprietary License (OPL-1).
+# - You are NOT permitted to modify, copy, redistribute, or reuse any part of
+#   this source code without the explicit written consent of the author.
+# - Partial use, extraction, reverse engineering, or integration of this code
+#   into other projects without authorization is strictly prohibited.
+# - Any commercial use or deployment must be approved directly by:
+#     Mohamed Samir Abouelez 
+#     Email: kenzey0man@gmail.com
+#
+# ---------------------------------------------------------------------------
+# © 2025 — All Rights Reserved — Mohamed Samir Abouelez 
+#################################################################################
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_dumps(payload, indent=False, default=None):
+    """Serialize payload to a JSON string, using orjson when it is installed
+
+    default is called for objects that cannot be serialized natively.
+    Output is compact unless indent is set, matching orjson.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=default, option=orjson.OPT_INDENT_2 if indent else None).decode()
+    if indent:
+        return json.dumps(payload, indent=2, default=default)
+    return json.dumps(payload, separators=(',', ':'), default=default)
+
+
+def json_loads(data):
+    """Parse JSON from str or bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -34,6 +34,28 @@ from odoo import api, models
 
 _logger = logging.getLogger(__name__)
 
+# Numeric level of each logger method name accepted by log_if_enabled()
+_LOG_LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    'critical': logging.CRITICAL,
+}
+
+
+def _js_logging_config(logging_mode):
+    enabled = logging_mode == 'production'
+    return {
+        'enabled': enabled,
+        'mode': logging_mode,
+        'levels': {'debug': enabled, 'info': enabled, 'warn': enabled, 'error': enabled},
+    }
+
+
+# JavaScript logging configuration of each server logging mode
+_JS_LOGGING_CONFIGS = {mode: _js_logging_config(mode) for mode in ('production', 'test')}
+
 
 class VoipLoggingUtils:
     """Utility class for conditional logging based on server mode"""
@@ -59,17 +81,10 @@ class VoipLoggingUtils:
                 except (ValueError, TypeError):
                     _logger.warning(f"Invalid server_id type, expected integer but got: {type(server_id).__name__} - {server_id}")
                     return 'production'
-                
-                server = env['voip.server'].browse(server_id)
-            else:
-                # Get the first active server
-                server = env['voip.server'].search([('active', '=', True)], limit=1)
             
-            if server and server.exists():
-                return server.logging_mode
-            else:
-                # Default to production if no server found
-                return 'production'
+            # Cached per server (or for the first active server when None);
+            # defaults to production if no server is found
+            return env['voip.server']._get_logging_mode(server_id or None)
         except Exception as e:
             _logger.warning(f"Error getting server logging mode: {e}")
             return 'production'
@@ -110,6 +125,9 @@ class VoipLoggingUtils:
             server_id: Server ID to check (keyword-only argument)
             **kwargs: Additional keyword arguments for logging
         """
+        # The logger's own level is checked first: it costs no server lookup
+        if not logger.isEnabledFor(_LOG_LEVELS[level]):
+            return
         if VoipLoggingUtils.should_log(env, server_id, level):
             getattr(logger, level)(message, *args, **kwargs)
     
@@ -123,17 +141,7 @@ class VoipLoggingUtils:
             server_id: Server ID to check
             
         Returns:
-            dict: Configuration for JavaScript logging
+            dict: Configuration for JavaScript logging, shared between
+            calls: it must not be modified
         """
-        logging_mode = VoipLoggingUtils.get_server_logging_mode(env, server_id)
-        
-        return {
-            'enabled': logging_mode == 'production',
-            'mode': logging_mode,
-            'levels': {
-                'debug': logging_mode == 'production',
-                'info': logging_mode == 'production',
-                'warn': logging_mode == 'production',
-                'error': logging_mode == 'production'
-            }
-        }
+        return _JS_LOGGING_CONFIGS[VoipLoggingUtils.get_server_logging_mode(env, server_id)]